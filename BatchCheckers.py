@@ -0,0 +1,166 @@
+import numpy as np
+
+import Zobrist
+
+from Bitboard import VECTORS, square_targets
+
+BOARD_SIZE = 8
+PAWN_ROWS = 3
+SQUARES = Zobrist.SQUARES
+OFF_BOARD = SQUARES
+DIRECTIONS = len(VECTORS)
+ACTIONS = SQUARES * DIRECTIONS
+
+SQUARE_FIELDS = Zobrist.FIELDS
+SQUARE_ROWS = np.array([field[0] for field in SQUARE_FIELDS])
+SQUARE_COLUMNS = np.array([field[1] for field in SQUARE_FIELDS])
+
+
+def build_targets(distance):
+    return np.array([[OFF_BOARD if target is None else target for target in row]
+                     for row in square_targets(distance)], dtype=np.intp)
+
+
+NEIGHBORS = build_targets(1)
+LANDINGS = build_targets(2)
+# directions a pawn may walk in, per player
+FORWARD = np.array([[True, True, False, False], [False, False, True, True]])
+PROMOTION_ROWS = np.array([BOARD_SIZE - 1, 0])
+
+
+class BatchGameState:
+
+    def __init__(self, count):
+        self.count = count
+        # one extra column holds a sentinel for steps off the board
+        self.boards = np.full((count, SQUARES + 1), -2, dtype=np.int8)
+        self.player = np.zeros(count, dtype=np.int8)
+        self.only_viable_field = np.full(count, -1, dtype=np.intp)
+        self.pacifist_turns = np.zeros(count, dtype=np.int32)
+        self.game_ended = np.zeros(count, dtype=bool)
+        self.game_drawn = np.zeros(count, dtype=bool)
+        self.reset()
+
+    @classmethod
+    def from_states(cls, states):
+        batch = cls(len(states))
+        for n, state in enumerate(states):
+            for s, field in enumerate(SQUARE_FIELDS):
+                batch.boards[n, s] = state.get_field(field)
+            batch.player[n] = state.player
+            if state.only_viable_field is not None:
+                batch.only_viable_field[n] = Zobrist.square(state.only_viable_field)
+            batch.pacifist_turns[n] = state.pacifist_turns
+            batch.game_ended[n] = state.game_ended
+            batch.game_drawn[n] = state.game_drawn
+        return batch
+
+    def reset(self):
+        self.boards[:, :SQUARES] = -1
+        self.boards[:, :PAWN_ROWS * 4] = 0
+        self.boards[:, SQUARES - PAWN_ROWS * 4:SQUARES] = 1
+        self.player[:] = 0
+        self.only_viable_field[:] = -1
+        self.pacifist_turns[:] = 0
+        self.game_ended[:] = False
+        self.game_drawn[:] = False
+
+    def get_winner(self):
+        winner = np.where(self.game_ended & ~self.game_drawn, 1 - self.player, -1)
+        return winner.astype(np.int8)
+
+    def get_field(self, index, field):
+        return int(self.boards[index, Zobrist.square(field)])
+
+    def get_viable_moves(self):
+        boards = self.boards
+        occupied = boards >= 0
+        own = occupied & (boards % 2 == self.player[:, None])
+        opponent = occupied & ~own
+        empty = boards == -1
+        movers = own[:, :SQUARES, None]
+        jumps = movers & opponent[:, NEIGHBORS] & empty[:, LANDINGS]
+        allowed = FORWARD[self.player][:, None, :] | (boards[:, :SQUARES, None] >= 2)
+        walks = movers & empty[:, NEIGHBORS] & allowed
+        jumps = jumps.reshape(self.count, ACTIONS)
+        walks = walks.reshape(self.count, ACTIONS)
+
+        restricted = self.only_viable_field >= 0
+        if restricted.any():
+            field_mask = np.zeros((self.count, SQUARES), dtype=bool)
+            rows = np.nonzero(restricted)[0]
+            field_mask[rows, self.only_viable_field[rows]] = True
+            field_mask = np.repeat(field_mask, DIRECTIONS, axis=1) | ~restricted[:, None]
+            jumps &= field_mask
+            walks &= field_mask
+
+        has_jumps = jumps.any(axis=1)
+        moves = np.where(has_jumps[:, None], jumps, walks)
+        walk_phase = ~has_jumps & ~restricted
+        self.update_draws(walk_phase)
+        self.game_ended |= walk_phase & (~walks.any(axis=1) | self.game_drawn)
+        return moves
+
+    def update_draws(self, walk_phase):
+        boards = self.boards[:, :SQUARES]
+        self.game_drawn |= walk_phase & (self.pacifist_turns >= 50)
+        pawns = ((boards == 0) | (boards == 1)).sum(axis=1)
+        kings = [(boards == 2).sum(axis=1), (boards == 3).sum(axis=1)]
+        lone_kings = walk_phase & (pawns == 0) & (kings[0] == 1) & (kings[1] == 1)
+        if lone_kings.any():
+            first = np.argmax(boards == 2, axis=1)
+            second = np.argmax(boards == 3, axis=1)
+            distant = ((np.abs(SQUARE_ROWS[first] - SQUARE_ROWS[second]) > 1)
+                       | (np.abs(SQUARE_COLUMNS[first] - SQUARE_COLUMNS[second]) > 1))
+            self.game_drawn |= lone_kings & distant
+
+    def perform_actions(self, actions):
+        rows = np.nonzero(actions >= 0)[0]
+        if len(rows) == 0:
+            return
+        origins, directions = actions[rows] // DIRECTIONS, actions[rows] % DIRECTIONS
+        middles = NEIGHBORS[origins, directions]
+        is_jump = self.boards[rows, middles] != -1
+        destinations = np.where(is_jump, LANDINGS[origins, directions], middles)
+
+        figures = self.boards[rows, origins]
+        promoted = (figures < 2) & (SQUARE_ROWS[destinations] == PROMOTION_ROWS[figures % 2])
+        self.boards[rows, destinations] = np.where(promoted, figures + 2, figures)
+        self.boards[rows, origins] = -1
+
+        jump_rows, walk_rows = rows[is_jump], rows[~is_jump]
+        self.pacifist_turns[walk_rows] += 1
+        self.player[walk_rows] = 1 - self.player[walk_rows]
+        self.pacifist_turns[jump_rows] = 0
+        self.boards[jump_rows, middles[is_jump]] = -1
+
+        landed = destinations[is_jump]
+        boards = self.boards[jump_rows]
+        occupied = boards >= 0
+        own = occupied & (boards % 2 == self.player[jump_rows][:, None])
+        opponent = occupied & ~own
+        steps = np.arange(len(jump_rows))[:, None]
+        continues = (opponent[steps, NEIGHBORS[landed]] & (boards[steps, LANDINGS[landed]] == -1)).any(axis=1)
+        self.only_viable_field[jump_rows] = np.where(continues, landed, -1)
+        finished = jump_rows[~continues]
+        self.player[finished] = 1 - self.player[finished]
+
+    def random_actions(self, moves, rng=np.random):
+        scores = rng.random_sample(moves.shape) * moves
+        actions = np.argmax(scores, axis=1)
+        return np.where(moves.any(axis=1) & ~self.game_ended, actions, -1)
+
+    def get_moves(self, moves, index):
+        result = []
+        for action in np.nonzero(moves[index])[0]:
+            origin, direction = divmod(int(action), DIRECTIONS)
+            middle = NEIGHBORS[origin, direction]
+            destination = middle if self.boards[index, middle] == -1 else LANDINGS[origin, direction]
+            result.append((SQUARE_FIELDS[origin], SQUARE_FIELDS[destination]))
+        return result
+
+    def get_action(self, move):
+        origin, destination = move
+        di = 1 if destination[0] > origin[0] else -1
+        dj = 1 if destination[1] > origin[1] else -1
+        return Zobrist.square(origin) * DIRECTIONS + VECTORS.index((di, dj))
@@ -0,0 +1,341 @@
+import Zobrist
+
+from MoveCache import copy_sharing_cache, state_without_cache
+
+BOARD_SIZE = 8
+PAWN_ROWS = 3
+
+# Playable squares are packed with one ghost square per two rows, so every
+# diagonal step is a constant shift: +4/+5 up the board, -5/-4 down.
+FIELD_BITS = {}
+BIT_FIELDS = {}
+for i in range(BOARD_SIZE):
+    for j in range(i % 2, BOARD_SIZE, 2):
+        FIELD_BITS[(i, j)] = (9 * i + j) // 2
+        BIT_FIELDS[(9 * i + j) // 2] = (i, j)
+
+BIT_SQUARES = {bit: Zobrist.square(field) for bit, field in BIT_FIELDS.items()}
+
+VALID = 0
+for bit in BIT_FIELDS:
+    VALID |= 1 << bit
+
+ROWS = [0] * BOARD_SIZE
+for bit, (i, j) in BIT_FIELDS.items():
+    ROWS[i] |= 1 << bit
+
+# rows a pawn has advanced from its own back rank
+ADVANCEMENT = (
+    {bit: field[0] for bit, field in BIT_FIELDS.items()},
+    {bit: BOARD_SIZE - 1 - field[0] for bit, field in BIT_FIELDS.items()},
+)
+
+MOVEMENT_SHIFTS = ((4, 5), (-5, -4))
+JUMP_SHIFTS = MOVEMENT_SHIFTS[0] + MOVEMENT_SHIFTS[1]
+
+
+# the diagonals of JUMP_SHIFTS as row and column steps, in the same order
+VECTORS = ((1, -1), (1, 1), (-1, -1), (-1, 1))
+
+
+def square_targets(distance):
+    # for modules that index squares in Zobrist order (BatchCheckers,
+    # Tablebase): the square distance steps along each of VECTORS, or None
+    # once a step leaves the board
+    targets = []
+    for field in Zobrist.FIELDS:
+        row = []
+        for s in JUMP_SHIFTS:
+            bit = FIELD_BITS[field]
+            for step in range(distance):
+                bit = bit + s if bit is not None and bit + s in BIT_FIELDS else None
+            row.append(None if bit is None else BIT_SQUARES[bit])
+        targets.append(row)
+    return targets
+
+
+def shift(x, s):
+    if s > 0:
+        return x << s
+    return x >> -s
+
+
+def squares(x):
+    # drops the ghost bits, giving a mask in Zobrist square order
+    return ((x & 0xF) | (x >> 1 & 0xFF0) | (x >> 2 & 0xFF000)
+            | (x >> 3 & 0xFF00000) | (x >> 4 & 0xF0000000))
+
+
+def bits(x):
+    while x:
+        low = x & -x
+        yield low.bit_length() - 1
+        x ^= low
+
+
+def build_walks(shifts):
+    table = {}
+    for bit, field in BIT_FIELDS.items():
+        entries = []
+        for s in shifts:
+            land = bit + s
+            if land in BIT_FIELDS:
+                entries.append((1 << land, (field, BIT_FIELDS[land])))
+        table[bit] = tuple(entries)
+    return table
+
+
+def build_jumps():
+    table = {}
+    for bit, field in BIT_FIELDS.items():
+        entries = []
+        for s in JUMP_SHIFTS:
+            middle, land = bit + s, bit + 2 * s
+            if middle in BIT_FIELDS and land in BIT_FIELDS:
+                entries.append((1 << middle, 1 << land, (field, BIT_FIELDS[land])))
+        table[bit] = tuple(entries)
+    return table
+
+
+WALKS = (build_walks(MOVEMENT_SHIFTS[0]), build_walks(MOVEMENT_SHIFTS[1]))
+JUMPS = build_jumps()
+
+
+class BitboardGameState:
+
+    def __init__(self, move_cache=None):
+        self.move_cache = move_cache
+        self.board_size = BOARD_SIZE
+        self.pawn_rows = PAWN_ROWS
+        self.game_ended = False
+        self.pieces = [0, 0]
+        self.kings = 0
+        self.pacifist_turns = 0
+        self.reset()
+
+    @classmethod
+    def from_state(cls, state, move_cache=None):
+        result = cls(move_cache)
+        result.pieces = [0, 0]
+        result.kings = 0
+        for field, bit in FIELD_BITS.items():
+            figure = state.get_field(field)
+            if figure >= 0:
+                result.pieces[figure % 2] |= 1 << bit
+                if figure >= 2:
+                    result.kings |= 1 << bit
+        result.player = state.player
+        result.only_viable_field = state.only_viable_field
+        result.pacifist_turns = state.pacifist_turns
+        result.game_ended = state.game_ended
+        result.game_drawn = state.game_drawn
+        result.count_pieces()
+        result.hash = Zobrist.compute_hash(result)
+        return result
+
+    def get_winner(self):
+        if not self.game_ended:
+            return None
+        if self.game_drawn:
+            return None
+        return 1 - self.player
+
+    def reset(self):
+        self.player = 0
+        self.only_viable_field = None
+        self.pacifist_turns = 0
+        self.game_ended = False
+        self.game_drawn = False
+        self.pieces = [0, 0]
+        self.kings = 0
+        for i in range(self.pawn_rows):
+            self.pieces[0] |= ROWS[i]
+            self.pieces[1] |= ROWS[self.board_size - 1 - i]
+        self.count_pieces()
+        self.hash = Zobrist.compute_hash(self)
+
+    def count_pieces(self):
+        self.figures = [0, 0, 0, 0]
+        self.advancement = [0, 0]
+        self.back_rank = [0, 0]
+        for player in range(2):
+            for bit in bits(self.pieces[player]):
+                self.count_figure(player + (2 if self.kings >> bit & 1 else 0), bit, 1)
+
+    def count_figure(self, figure, bit, sign):
+        self.figures[figure] += sign
+        if figure < 2:
+            row = ADVANCEMENT[figure][bit]
+            self.advancement[figure] += sign * row
+            if row == 0:
+                self.back_rank[figure] += sign
+
+    def get_counters(self):
+        return tuple(self.figures) + tuple(self.advancement) + tuple(self.back_rank)
+
+    def set_counters(self, counters):
+        self.figures[:] = counters[0:4]
+        self.advancement[:] = counters[4:6]
+        self.back_rank[:] = counters[6:8]
+
+    def get_field(self, field):
+        i, j = field
+        if i >= self.board_size or i < 0 or j >= self.board_size or j < 0:
+            return None
+        bit = FIELD_BITS.get(field)
+        if bit is None:
+            return -1
+        mask = 1 << bit
+        for player in range(2):
+            if self.pieces[player] & mask:
+                return player + (2 if self.kings & mask else 0)
+        return -1
+
+    def get_masks(self):
+        return [squares(self.pieces[0]), squares(self.pieces[1]), squares(self.kings)]
+
+    def get_jumpers(self, own, opponent, empty):
+        jumpers = 0
+        for s in JUMP_SHIFTS:
+            jumpers |= shift(opponent, -s) & shift(empty, -2 * s)
+        return own & jumpers
+
+    def has_jumps(self):
+        own, opponent = self.pieces[self.player], self.pieces[1 - self.player]
+        return self.get_jumpers(own, opponent, VALID & ~(own | opponent)) != 0
+
+    def get_walkers(self, own, empty):
+        forward, backward = MOVEMENT_SHIFTS[self.player], MOVEMENT_SHIFTS[1 - self.player]
+        walkers = own & (shift(empty, -forward[0]) | shift(empty, -forward[1]))
+        kings = own & self.kings
+        walkers |= kings & (shift(empty, -backward[0]) | shift(empty, -backward[1]))
+        return walkers
+
+    def __deepcopy__(self, memo):
+        return copy_sharing_cache(self, memo)
+
+    def __getstate__(self):
+        return state_without_cache(self)
+
+    def get_viable_moves(self):
+        if self.move_cache is None:
+            moves, walk_phase = self.generate_moves()
+        else:
+            entry = self.move_cache.get(self.hash)
+            if entry is None:
+                entry = self.generate_moves()
+                self.move_cache.put(self.hash, entry)
+            moves, walk_phase = entry
+        if walk_phase:
+            self.check_draws(moves)
+        return moves
+
+    def generate_moves(self):
+        if not self.only_viable_field is None:
+            return self.get_viable_moves_from_field(self.only_viable_field)[1], False
+        own, opponent = self.pieces[self.player], self.pieces[1 - self.player]
+        empty = VALID & ~(own | opponent)
+        jumpers = self.get_jumpers(own, opponent, empty)
+        if jumpers:
+            jumps = []
+            for bit in bits(jumpers):
+                self.gather_viable_jumps(bit, opponent, empty, jumps)
+            return jumps, False
+        walks = []
+        for bit in bits(self.get_walkers(own, empty)):
+            self.gather_viable_walks(bit, empty, walks)
+        return walks, True
+
+    def check_draws(self, walks):
+        if self.pacifist_turns >= 50:
+            self.game_drawn = True
+        figures = self.figures
+        if figures[0] == 0 and figures[1] == 0 and figures[2] == 1 and figures[3] == 1:
+            field_0 = BIT_FIELDS[self.pieces[0].bit_length() - 1]
+            field_1 = BIT_FIELDS[self.pieces[1].bit_length() - 1]
+            if abs(field_0[0] - field_1[0]) > 1 or abs(field_0[1] - field_1[1]) > 1:
+                self.game_drawn = True
+        if len(walks) == 0 or self.game_drawn:
+            self.game_ended = True
+
+    def gather_viable_walks(self, bit, empty, walks):
+        for land, move in WALKS[self.player][bit]:
+            if empty & land:
+                walks.append(move)
+        if self.kings & (1 << bit):
+            for land, move in WALKS[1 - self.player][bit]:
+                if empty & land:
+                    walks.append(move)
+
+    def gather_viable_jumps(self, bit, opponent, empty, jumps):
+        for middle, land, move in JUMPS[bit]:
+            if opponent & middle and empty & land:
+                jumps.append(move)
+
+    def get_viable_moves_from_field(self, field):
+        bit = FIELD_BITS[field]
+        own, opponent = self.pieces[self.player], self.pieces[1 - self.player]
+        empty = VALID & ~(own | opponent)
+        jumps = []
+        self.gather_viable_jumps(bit, opponent, empty, jumps)
+        if len(jumps) > 0:
+            return 1, jumps
+        walks = []
+        self.gather_viable_walks(bit, empty, walks)
+        return 0, walks
+
+    def perform_action(self, move):
+        record = (self.pieces[0], self.pieces[1], self.kings, self.player, self.only_viable_field,
+                  self.pacifist_turns, self.game_ended, self.game_drawn, self.hash, self.get_counters())
+        if move is None:
+            self.game_ended = True
+            return record
+        origin, destination = move
+        origin_bit, destination_bit = FIELD_BITS[origin], FIELD_BITS[destination]
+        origin_mask, destination_mask = 1 << origin_bit, 1 << destination_bit
+        owner = 0 if self.pieces[0] & origin_mask else 1
+        figure = owner + (2 if self.kings & origin_mask else 0)
+        self.hash ^= Zobrist.PIECES[figure][BIT_SQUARES[origin_bit]]
+        self.count_figure(figure, origin_bit, -1)
+        self.pieces[owner] ^= origin_mask | destination_mask
+        if figure > 1:
+            self.kings ^= origin_mask | destination_mask
+        elif destination_mask & ROWS[self.board_size - 1 if owner == 0 else 0]:
+            self.kings |= destination_mask
+            figure += 2
+        self.hash ^= Zobrist.PIECES[figure][BIT_SQUARES[destination_bit]]
+        self.count_figure(figure, destination_bit, 1)
+        if abs(origin[0] - destination[0]) == 2:
+            self.pacifist_turns = 0
+            middle_bit = (origin_bit + destination_bit) // 2
+            middle_mask = 1 << middle_bit
+            captured = (0 if self.pieces[0] & middle_mask else 1) + (2 if self.kings & middle_mask else 0)
+            self.hash ^= Zobrist.PIECES[captured][BIT_SQUARES[middle_bit]]
+            self.count_figure(captured, middle_bit, -1)
+            self.pieces[0] &= ~middle_mask
+            self.pieces[1] &= ~middle_mask
+            self.kings &= ~middle_mask
+            own, opponent = self.pieces[self.player], self.pieces[1 - self.player]
+            jumps = []
+            self.gather_viable_jumps(destination_bit, opponent, VALID & ~(own | opponent), jumps)
+            if self.only_viable_field is not None:
+                self.hash ^= Zobrist.ONLY_VIABLE_FIELD[Zobrist.square(self.only_viable_field)]
+            if len(jumps) > 0:
+                self.only_viable_field = destination
+                self.hash ^= Zobrist.ONLY_VIABLE_FIELD[BIT_SQUARES[destination_bit]]
+                if self.move_cache is not None:
+                    self.move_cache.put(self.hash, (jumps, False))
+            else:
+                self.only_viable_field = None
+                self.player = 1 - self.player
+                self.hash ^= Zobrist.PLAYER
+        else:
+            self.pacifist_turns += 1
+            self.player = 1 - self.player
+            self.hash ^= Zobrist.PLAYER
+        return record
+
+    def undo_action(self, record):
+        (self.pieces[0], self.pieces[1], self.kings, self.player, self.only_viable_field,
+         self.pacifist_turns, self.game_ended, self.game_drawn, self.hash, counters) = record
+        self.set_counters(counters)
@@ -1,10 +1,16 @@
 import abc
+import time
 
+import Instrumentation
+import Zobrist
+
+from MoveCache import copy_sharing_cache, state_without_cache
 from util import add, div
 
 class GameState:
 
-    def __init__(self):
+    def __init__(self, move_cache=None):
+        self.move_cache = move_cache
         self.board_size = 8
         self.pawn_rows = 3
         self.game_ended = False
@@ -13,6 +19,43 @@ class GameState:
         self.pacifist_turns = 0
         self.reset()
 
+    @classmethod
+    def from_state(cls, state, move_cache=None):
+        result = cls(move_cache)
+        result.board = [[state.get_field((i, j)) for j in range(result.board_size)]
+                        for i in range(result.board_size)]
+        result.player = state.player
+        result.only_viable_field = state.only_viable_field
+        result.pacifist_turns = state.pacifist_turns
+        result.game_ended = state.game_ended
+        result.game_drawn = state.game_drawn
+        result.count_pieces()
+        result.hash = Zobrist.compute_hash(result)
+        return result
+
+    def count_pieces(self):
+        self.figures = [0, 0, 0, 0]
+        self.advancement = [0, 0]
+        self.back_rank = [0, 0]
+        self.piece_fields = [set(), set()]
+        for i in range(self.board_size):
+            for j in range(self.board_size):
+                if self.board[i][j] >= 0:
+                    self.count_figure(self.board[i][j], (i, j), 1)
+
+    def count_figure(self, figure, field, sign):
+        player = figure % 2
+        self.figures[figure] += sign
+        if sign > 0:
+            self.piece_fields[player].add(field)
+        else:
+            self.piece_fields[player].discard(field)
+        if figure < 2:
+            row = field[0] if player == 0 else self.board_size - 1 - field[0]
+            self.advancement[player] += sign * row
+            if row == 0:
+                self.back_rank[player] += sign
+
     def get_winner(self):
         if not self.game_ended:
             return None
@@ -23,6 +66,7 @@ class GameState:
     def reset(self):
         self.player = 0
         self.only_viable_field = None
+        self.pacifist_turns = 0
         self.game_ended = False
         self.game_drawn = False
         for i in range(0, self.pawn_rows):
@@ -35,6 +79,8 @@ class GameState:
             for j in range(0, self.board_size, 2):
                 self.board[i][j + ((i + 1) % 2)] = -1
                 self.board[i][j + (i % 2)] = 1
+        self.count_pieces()
+        self.hash = Zobrist.compute_hash(self)
 
     def get_field(self, field):
         i, j = field
@@ -43,43 +89,64 @@ class GameState:
         return self.board[i][j]
 
 
+    def get_masks(self):
+        masks = [0, 0, 0]
+        for player in range(2):
+            for field in self.piece_fields[player]:
+                bit = 1 << Zobrist.square(field)
+                masks[player] |= bit
+                if self.board[field[0]][field[1]] > 1:
+                    masks[2] |= bit
+        return masks
+
+
+    def __deepcopy__(self, memo):
+        return copy_sharing_cache(self, memo)
+
+    def __getstate__(self):
+        return state_without_cache(self)
+
     def get_viable_moves(self):
+        if self.move_cache is None:
+            moves, walk_phase = self.generate_moves()
+        else:
+            entry = self.move_cache.get(self.hash)
+            if entry is None:
+                entry = self.generate_moves()
+                self.move_cache.put(self.hash, entry)
+            moves, walk_phase = entry
+        if walk_phase:
+            self.check_draws(moves)
+        return moves
+
+    def generate_moves(self):
         if not self.only_viable_field is None:
-            return self.get_viable_moves_from_field(self.only_viable_field)[1]
+            return self.get_viable_moves_from_field(self.only_viable_field)[1], False
+        own_fields = sorted(self.piece_fields[self.player])
         jumps = []
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                field = self.get_field((i, j))
-                if field != None and field >= 0 and field % 2 == self.player:
-                    self.gather_viable_jumps((i, j), jumps)
+        for field in own_fields:
+            self.gather_viable_jumps(field, jumps)
         if len(jumps) > 0:
-            return jumps
+            return jumps, False
         walks = []
-        kings = [0,0]
-        pawns = 0
-        kings_pos = [None, None]
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                field = self.get_field((i, j))
-                if field > 1:
-                    kings[field % 2] += 1
-                    kings_pos[field % 2] = (i, j)
-                elif field >= 0:
-                    pawns += 1
-                if field >= 0 and field % 2 == self.player:
-                    self.gather_viable_walks(self.player, (i, j), walks)
-                    if field > 1:
-                        self.gather_viable_walks(1 - self.player, (i, j), walks)
+        for field in own_fields:
+            self.gather_viable_walks(self.player, field, walks)
+            if self.get_field(field) > 1:
+                self.gather_viable_walks(1 - self.player, field, walks)
+        return walks, True
+
+    def check_draws(self, walks):
         if self.pacifist_turns >= 50:
             self.game_drawn = True
-        if pawns == 0 and kings[0] == kings[1] and kings[0] == 1:
+        figures = self.figures
+        if figures[0] == 0 and figures[1] == 0 and figures[2] == 1 and figures[3] == 1:
+            kings_pos = [next(iter(fields)) for fields in self.piece_fields]
             diff_y = abs(kings_pos[0][0] - kings_pos[1][0])
             diff_x = abs(kings_pos[0][1] - kings_pos[1][1])
             if diff_y > 1 or diff_x > 1:
                 self.game_drawn = True
         if len(walks) == 0 or self.game_drawn:
             self.game_ended = True
-        return walks
 
 
     def get_walk(self, origin, vector):
@@ -110,6 +177,12 @@ class GameState:
                 walks.append(move)
 
 
+    def has_jumps(self):
+        vectors = self.movement_vectors[0] + self.movement_vectors[1]
+        return any(self.get_jump(field, vector) is not None
+                   for field in self.piece_fields[self.player] for vector in vectors)
+
+
     def gather_viable_jumps(self, field, jumps):
         for vector in self.movement_vectors[0] + self.movement_vectors[1]:
             move = self.get_jump(field, vector)
@@ -131,11 +204,14 @@ class GameState:
 
 
     def perform_action(self, move):
+        flags = (self.player, self.only_viable_field, self.pacifist_turns,
+                 self.game_ended, self.game_drawn, self.hash)
         if move is None:
             self.game_ended = True
-            return
+            return (move, None, None) + flags
         origin, destination = move
-        figure = self.get_field(origin)
+        original_figure = figure = self.get_field(origin)
+        captured = None
         if figure == 0 and destination[0] == self.board_size - 1:
             figure = 2
         if figure == 1 and destination[0] == 0:
@@ -145,16 +221,37 @@ class GameState:
         if abs(move[0][0] - move[1][0]) == 2:
             self.pacifist_turns = 0
             half_destination = div(add(origin, destination), 2)
+            captured = self.get_field(half_destination)
             self.remove_figure(half_destination)
-            move_type, _ = self.get_viable_moves_from_field(destination)
+            move_type, jumps = self.get_viable_moves_from_field(destination)
+            if self.only_viable_field is not None:
+                self.hash ^= Zobrist.ONLY_VIABLE_FIELD[Zobrist.square(self.only_viable_field)]
             if move_type == 1:
                 self.only_viable_field = destination
+                self.hash ^= Zobrist.ONLY_VIABLE_FIELD[Zobrist.square(destination)]
+                if self.move_cache is not None:
+                    self.move_cache.put(self.hash, (jumps, False))
             else:
                 self.only_viable_field = None
                 self.player = 1 - self.player
+                self.hash ^= Zobrist.PLAYER
         else:
             self.pacifist_turns += 1
             self.player = 1 - self.player
+            self.hash ^= Zobrist.PLAYER
+        return (move, original_figure, captured) + flags
+
+
+    def undo_action(self, record):
+        move, figure, captured = record[:3]
+        if move is not None:
+            origin, destination = move
+            self.remove_figure(destination)
+            self.add_figure(figure, origin)
+            if captured is not None:
+                self.add_figure(captured, div(add(origin, destination), 2))
+        (self.player, self.only_viable_field, self.pacifist_turns,
+         self.game_ended, self.game_drawn, self.hash) = record[3:]
 
 
     def add_figure(self, figure, field):
@@ -166,21 +263,37 @@ class GameState:
 
 
     def set_field(self, field, value):
+        square = Zobrist.square(field)
+        previous = self.board[field[0]][field[1]]
+        if previous >= 0:
+            self.hash ^= Zobrist.PIECES[previous][square]
+            self.count_figure(previous, field, -1)
+        if value >= 0:
+            self.hash ^= Zobrist.PIECES[value][square]
+            self.count_figure(value, field, 1)
         self.board[field[0]][field[1]] = value
 
 class Game:
 
-    def __init__(self):
-        self.state = GameState()
+    def __init__(self, state=None):
+        self.state = GameState() if state is None else state
         self.observers = []
         self.players = [None, None]
+        self.history = []
 
     def play(self):
         self.state.reset()
+        self.history = []
         self.notify_board_changed()
         self.notify_turn_passed()
         while True:
-            move = self.players[self.state.player].take_turn(self.state)
+            position, player = self.state.hash, self.state.player
+            start = time.perf_counter() if Instrumentation.ENABLED else None
+            move = self.players[player].take_turn(self.state)
+            if move is not None:
+                self.history.append((position, player, move))
+            if start is not None:
+                Instrumentation.record_move(self, player, move, time.perf_counter() - start)
             self.notify_move_made(move)
             self.notify_board_changed()
             if self.state.game_ended:
@@ -248,10 +361,15 @@ class GamePlayer(metaclass = abc.ABCMeta):
     def move_made(self, move):
         pass
 
+    def close(self):
+        # releases background processes, the player may still be reused
+        pass
+
 class GameRunner:
 
     def __init__(self, game, player_one, player_two):
         self.game = game
+        self.players = (player_one, player_two)
         player_one.set_game(game)
         player_two.set_game(game)
         player_one.set_index(1)
@@ -259,7 +377,11 @@ class GameRunner:
 
 
     def run(self):
-        return self.game.play()
+        try:
+            return self.game.play()
+        finally:
+            for player in self.players:
+                player.close()
 
 class TerminalGameVisualizer(GameObserver):
 
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def write_entries(path, header, fields, dtype, rows, load_factor=0.5):
+    # open addressing on the low bits of the key, read back with a memmap;
+    # rows with the same key sit in one probe run, and a zeroed slot ends it
+    capacity = 1
+    while capacity <= len(rows) / load_factor:
+        capacity *= 2
+    mask = capacity - 1
+    used = np.zeros(capacity, dtype=bool)
+    table = np.zeros(capacity, dtype=dtype)
+    for row in rows:
+        slot = row[0] & mask
+        while used[slot]:
+            slot = (slot + 1) & mask
+        used[slot] = True
+        table[slot] = row
+    with open(path, 'wb') as f:
+        f.write(header.pack(fields[0], capacity, len(rows), *fields[1:]))
+        table.tofile(f)
+
+
+def read_entries(path, header, magic, dtype, kind):
+    with open(path, 'rb') as f:
+        found, capacity, size, *fields = header.unpack(f.read(header.size))
+    if found != magic:
+        raise ValueError("Not %s: %s" % (kind, path))
+    table = np.memmap(path, dtype=dtype, mode='r', offset=header.size, shape=(capacity,))
+    return table, size, fields
+
+
+def find_entries(table, key, free):
+    # the rows stored under key, as tuples; free names a field that is zero
+    # only in empty slots
+    mask = len(table) - 1
+    free = table.dtype.names.index(free)
+    slot = key & mask
+    while True:
+        row = table[slot].item()
+        if row[free] == 0:
+            return
+        if row[0] == key:
+            yield row
+        slot = (slot + 1) & mask
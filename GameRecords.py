@@ -0,0 +1,149 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from Checkers import GameObserver
+from OpeningBook import decode_move, encode_move
+
+MAGIC = b'CKREC001'
+HEADER = struct.Struct('<8s?')
+# compressed files are a sequence of (records, payload bytes) chunks,
+# plain files hold the records back to back so they can be memory-mapped
+CHUNK = struct.Struct('<II')
+# pieces and kings are masks in Zobrist square order, result is the
+# winner of the game or DRAW, the final position of a game has NO_MOVE
+RECORD = np.dtype([('pieces', '<u4', (2,)), ('kings', '<u4'), ('move', '<u2'),
+                   ('player', 'u1'), ('result', 'i1')])
+NO_MOVE = 0xFFFF
+DRAW = -1
+
+
+def read_header(f, path):
+    header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError("Not a game record file: %s" % path)
+    magic, compressed = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("Not a game record file: %s" % path)
+    return compressed
+
+
+class RecordWriter:
+
+    def __init__(self, path, compress=False, chunk_size=1 << 16, level=6):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.level = level
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                self.compress = read_header(f, path)
+            if self.compress != compress:
+                raise ValueError("%s is %scompressed" % (path, '' if self.compress else 'not '))
+            self.file = open(path, 'ab')
+        else:
+            self.compress = compress
+            self.file = open(path, 'ab')
+            self.file.write(HEADER.pack(MAGIC, compress))
+        self.pending = []
+        self.pending_records = 0
+        self.written = 0
+
+    def write(self, records):
+        self.pending.append(records)
+        self.pending_records += len(records)
+        if self.pending_records >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending_records == 0:
+            return
+        data = np.concatenate(self.pending).tobytes()
+        if self.compress:
+            data = zlib.compress(data, self.level)
+            self.file.write(CHUNK.pack(self.pending_records, len(data)))
+        self.file.write(data)
+        self.file.flush()
+        self.written += self.pending_records
+        self.pending = []
+        self.pending_records = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class GameRecorder(GameObserver):
+
+    def __init__(self, game, writer=None):
+        super(GameRecorder, self).__init__(game)
+        self.writer = writer
+        self.records = None
+        self.rows = []
+        self.recorded = 0
+        self.position = None
+
+    def board_changed(self):
+        history = self.game.history
+        if self.position is not None and len(history) > self.recorded:
+            self.rows.append(self.position + (encode_move(history[-1][2]),))
+            self.recorded = len(history)
+        state = self.game.state
+        masks = state.get_masks()
+        self.position = ((masks[0], masks[1]), masks[2], state.player)
+
+    def turn_passed(self, passed_to):
+        pass
+
+    def game_ended(self, winner):
+        self.rows.append(self.position + (NO_MOVE,))
+        result = DRAW if winner is None else winner
+        self.records = np.array([(pieces, kings, move, player, result)
+                                 for pieces, kings, player, move in self.rows], dtype=RECORD)
+        if self.writer is not None:
+            self.writer.write(self.records)
+        self.rows = []
+        self.recorded = 0
+        self.position = None
+
+
+def read_chunks(path, chunk_size=1 << 16):
+    with open(path, 'rb') as f:
+        compressed = read_header(f, path)
+        while True:
+            if compressed:
+                header = f.read(CHUNK.size)
+                if len(header) < CHUNK.size:
+                    return
+                count, size = CHUNK.unpack(header)
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                yield np.frombuffer(zlib.decompress(payload), dtype=RECORD, count=count)
+            else:
+                data = f.read(chunk_size * RECORD.itemsize)
+                count = len(data) // RECORD.itemsize
+                if count == 0:
+                    return
+                yield np.frombuffer(data, dtype=RECORD, count=count)
+
+
+def read_positions(path):
+    for chunk in read_chunks(path):
+        yield from chunk
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        if read_header(f, path):
+            raise ValueError("Compressed records cannot be memory-mapped: %s" % path)
+    count = (os.path.getsize(path) - HEADER.size) // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,))
+
+
+def get_move(record):
+    move = int(record['move'])
+    return None if move == NO_MOVE else decode_move(move)
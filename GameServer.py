@@ -0,0 +1,289 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import random
+import time
+
+from collections import Counter, defaultdict, deque
+from copy import deepcopy
+
+import Checkers
+import Zobrist
+
+from single_game import PLAYER_TYPES, get_player
+from Tournament import ENGINES
+
+REMOTE = 'remote'
+# players cheap enough to run on the event loop, the rest go to the pool
+INLINE_PLAYERS = {'random', 'en_masse', 'flanking', 'aggressive'}
+
+
+def engine_move(task):
+    player_type, state, seed = task
+    random.seed(seed)
+    game = Checkers.Game(state)
+    player = get_player(player_type)
+    player.set_game(game)
+    start = time.perf_counter()
+    try:
+        move = player.take_turn(game.state)
+    finally:
+        player.close()
+    return move, time.perf_counter() - start
+
+
+def parse_move(move):
+    (a, b), (c, d) = move
+    return ((int(a), int(b)), (int(c), int(d)))
+
+
+class Metrics:
+
+    def __init__(self, window=10000):
+        self.counters = Counter()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def observe(self, name, seconds):
+        self.counters[name] += 1
+        self.samples[name].append(seconds)
+
+    def summary(self):
+        latencies = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            def percentile(p):
+                return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+            latencies[name] = {
+                'count': self.counters[name],
+                'mean': sum(ordered) / len(ordered),
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': ordered[-1],
+            }
+        return {'counters': dict(self.counters), 'latency': latencies}
+
+
+class ServerGame:
+
+    def __init__(self, server, game_id, players, connection, engine, move_timeout, engine_timeout):
+        self.server = server
+        self.id = game_id
+        self.players = players
+        self.connection = connection
+        self.state = ENGINES[engine]()
+        self.move_timeout = move_timeout
+        self.engine_timeout = engine_timeout
+        self.moves = asyncio.Queue()
+        # the remote player whose move is awaited, moves at other times are rejected
+        self.waiting = None
+        self.resigned = False
+        self.plies = 0
+        self.task = None
+
+    async def run(self):
+        metrics = self.server.metrics
+        metrics.count('games_started')
+        try:
+            while True:
+                moves = self.state.get_viable_moves()
+                if len(moves) == 0 or self.state.game_ended:
+                    self.finish(self.state.get_winner(), 'drawn' if self.state.game_drawn else 'no moves')
+                    return
+                player = self.state.player
+                if self.players[player] == REMOTE:
+                    move = await self.remote_move(player, moves)
+                    if move is None:
+                        metrics.count('move_timeouts')
+                        self.finish(1 - player, 'timeout')
+                        return
+                else:
+                    move = await self.engine_move(self.players[player], moves)
+                self.state.perform_action(move)
+                self.plies += 1
+                self.send({'type': 'moved', 'game': self.id, 'player': player, 'move': move})
+        except asyncio.CancelledError:
+            if not self.resigned:
+                metrics.count('games_abandoned')
+            raise
+        finally:
+            self.server.games.pop(self.id, None)
+
+    async def remote_move(self, player, moves):
+        self.send({
+            'type': 'turn', 'game': self.id, 'player': player, 'moves': moves,
+            'board': [self.state.get_field(field) for field in Zobrist.FIELDS],
+            'pacifist_turns': self.state.pacifist_turns,
+        })
+        start = time.perf_counter()
+        deadline = start + self.move_timeout
+        self.waiting = player
+        try:
+            while True:
+                try:
+                    move = await asyncio.wait_for(self.moves.get(), deadline - time.perf_counter())
+                except asyncio.TimeoutError:
+                    return None
+                if move in moves:
+                    self.server.metrics.observe('remote_move', time.perf_counter() - start)
+                    return move
+                self.server.metrics.count('illegal_moves')
+                self.send({'type': 'error', 'game': self.id, 'message': "Illegal move %s" % (move,)})
+        finally:
+            self.waiting = None
+
+    def submit(self, move):
+        # one move per turn, anything sent while an engine moves or after a
+        # move was already queued is rejected rather than played later
+        if self.waiting is None or not self.moves.empty():
+            self.server.metrics.count('moves_out_of_turn')
+            raise ValueError("Not a remote player's turn in game %s" % self.id)
+        self.moves.put_nowait(move)
+
+    def resign(self, player):
+        if self.resigned:
+            raise ValueError("Game %s is already over" % self.id)
+        if player not in (0, 1) or self.players[player] != REMOTE:
+            raise ValueError("Player %s is not a remote player in game %s" % (player, self.id))
+        self.resigned = True
+        self.task.cancel()
+        self.finish(1 - player, 'resigned')
+
+    async def engine_move(self, player_type, moves):
+        metrics = self.server.metrics
+        task = (player_type, deepcopy(self.state), random.getrandbits(32))
+        start = time.perf_counter()
+        if player_type in INLINE_PLAYERS:
+            move, elapsed = engine_move(task)
+        else:
+            loop = asyncio.get_event_loop()
+            future = loop.run_in_executor(self.server.executor, engine_move, task)
+            try:
+                move, elapsed = await asyncio.wait_for(future, self.engine_timeout)
+            except asyncio.TimeoutError:
+                # the worker cannot be interrupted, so its move is dropped
+                metrics.count('engine_timeouts')
+                move, elapsed = random.choice(moves), None
+        if elapsed is not None:
+            metrics.observe('engine_compute', elapsed)
+        metrics.observe('engine_move', time.perf_counter() - start)
+        return move
+
+    def finish(self, winner, reason):
+        self.server.metrics.count('games_finished')
+        self.send({'type': 'game_over', 'game': self.id, 'winner': winner, 'reason': reason,
+                   'plies': self.plies})
+
+    def send(self, message):
+        self.connection.send(message)
+
+
+class Connection:
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.games = {}
+
+    def send(self, message):
+        if not self.writer.transport.is_closing():
+            self.writer.write(json.dumps(message).encode() + b'\n')
+
+    async def serve(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                try:
+                    self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    self.server.metrics.count('bad_messages')
+                    self.send({'type': 'error', 'message': str(error)})
+                await self.writer.drain()
+                self.server.metrics.observe('message', time.perf_counter() - start)
+        except ConnectionError:
+            pass
+        finally:
+            for game in list(self.games.values()):
+                game.task.cancel()
+            self.writer.close()
+
+    def handle(self, message):
+        kind = message['type']
+        if kind == 'new_game':
+            players = message.get('players', [REMOTE, 'random'])
+            if len(players) != 2 or any(p != REMOTE and (p not in PLAYER_TYPES or p == 'manual')
+                                        for p in players):
+                raise ValueError("Unknown players: %s" % (players,))
+            game = self.server.create_game(
+                players, self, message.get('engine', self.server.engine),
+                float(message.get('move_timeout', self.server.move_timeout)))
+            self.games[game.id] = game
+            game.task.add_done_callback(lambda task, game_id=game.id: self.games.pop(game_id, None))
+            self.send({'type': 'game_started', 'game': game.id, 'players': players})
+        elif kind == 'move':
+            game = self.games.get(message['game'])
+            if game is None:
+                raise ValueError("No game %s on this connection" % message['game'])
+            game.submit(parse_move(message['move']))
+        elif kind == 'resign':
+            game = self.games.get(message['game'])
+            if game is None:
+                raise ValueError("No game %s on this connection" % message['game'])
+            game.resign(int(message['player']))
+        elif kind == 'stats':
+            self.send(dict(self.server.stats(), type='stats'))
+        else:
+            raise ValueError("Unknown message type: %s" % kind)
+
+
+class GameServer:
+
+    def __init__(self, workers=None, engine='bitboard', move_timeout=60.0, engine_timeout=30.0):
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+        self.engine = engine
+        self.move_timeout = move_timeout
+        self.engine_timeout = engine_timeout
+        self.metrics = Metrics()
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.connections = 0
+
+    def create_game(self, players, connection, engine, move_timeout):
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine: %s" % engine)
+        game = ServerGame(self, next(self.ids), players, connection, engine, move_timeout,
+                          self.engine_timeout)
+        self.games[game.id] = game
+        game.task = asyncio.get_event_loop().create_task(game.run())
+        return game
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            await Connection(self, reader, writer).serve()
+        finally:
+            self.connections -= 1
+
+    def stats(self):
+        return dict(self.metrics.summary(), games=len(self.games), connections=self.connections)
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        try:
+            # runs until cancelled, as Server.serve_forever does from Python 3.7
+            await asyncio.get_event_loop().create_future()
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,190 @@
+import atexit
+import csv
+import json
+import os
+import signal
+import sys
+
+from collections import Counter, defaultdict
+
+# CHECKERS_PROFILE=1 prints a summary at exit, any other value is used as a
+# prefix for PREFIX.json, PREFIX.csv and PREFIX.folded
+ENVIRONMENT = 'CHECKERS_PROFILE'
+ENABLED = False
+HOOK_INTERVAL = int(os.environ.get('CHECKERS_PROFILE_INTERVAL', 64))
+SAMPLE_PERIOD = float(os.environ.get('CHECKERS_PROFILE_SAMPLE', 0.001))
+
+
+class Profile:
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.calls = Counter()
+        self.stacks = Counter()
+        self.moves = []
+
+    def snapshot(self):
+        return {
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'calls': dict(self.calls),
+            'stacks': dict(self.stacks),
+            'moves': list(self.moves),
+        }
+
+    def drain(self):
+        result = self.snapshot()
+        self.__init__()
+        return result
+
+    def merge(self, snapshot):
+        for name, value in snapshot['counters'].items():
+            self.counters[name] += value
+        for name, value in snapshot['gauges'].items():
+            self.gauges[name] = self.gauges.get(name, 0) + value
+        self.calls.update(snapshot['calls'])
+        self.stacks.update(snapshot['stacks'])
+        self.moves.extend(snapshot['moves'])
+
+
+PROFILE = Profile()
+HOOKS = defaultdict(list)
+sampler_pid = None
+output = None
+
+
+def add_hook(name, hook):
+    HOOKS[name].append(hook)
+
+
+def count(name, value=1):
+    PROFILE.counters[name] += value
+
+
+def sample(name):
+    # called from hot loops, so only every HOOK_INTERVAL-th call does any work
+    calls = PROFILE.calls[name] = PROFILE.calls[name] + 1
+    if calls % HOOK_INTERVAL == 0:
+        frame = sys._getframe(1)
+        for hook in HOOKS.get(name, ()):
+            hook(name, frame)
+
+
+def record_move(game, player_index, move, elapsed):
+    player = game.players[player_index]
+    name = type(player).__name__
+    row = {'ply': len(game.history), 'player': player_index, 'type': name,
+           'move': None if move is None else str(move), 'turn_time': elapsed}
+    PROFILE.counters[name + '.moves'] += 1
+    PROFILE.counters[name + '.turn_time'] += elapsed
+    stats = getattr(player, 'stats', None)
+    if move is not None and stats:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[key] = value
+                # rates and averages do not add up across moves
+                if 'per_second' not in key and 'average' not in key:
+                    PROFILE.counters[name + '.' + key] += value
+    PROFILE.moves.append(row)
+
+
+def fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        names.append(module + ':' + getattr(code, 'co_qualname', code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def handle_sample(signum, frame):
+    PROFILE.stacks[fold(frame)] += 1
+
+
+def start_sampler():
+    # interval timers do not survive fork, so every process starts its own
+    global sampler_pid
+    if SAMPLE_PERIOD <= 0 or sampler_pid == os.getpid() or not hasattr(signal, 'setitimer'):
+        return
+    try:
+        signal.signal(signal.SIGPROF, handle_sample)
+    except ValueError:
+        return
+    signal.setitimer(signal.ITIMER_PROF, SAMPLE_PERIOD, SAMPLE_PERIOD)
+    sampler_pid = os.getpid()
+
+
+def stop_sampler():
+    global sampler_pid
+    if sampler_pid == os.getpid():
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        sampler_pid = None
+
+
+def export_json(path, profile=PROFILE):
+    with open(path, 'w') as f:
+        json.dump(profile.snapshot(), f, indent=2, sort_keys=True)
+
+
+def export_csv(path, profile=PROFILE):
+    columns = []
+    for row in profile.moves:
+        columns.extend(key for key in row if key not in columns)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(profile.moves)
+
+
+def export_folded(path, profile=PROFILE):
+    with open(path, 'w') as f:
+        for stack, samples in sorted(profile.stacks.items()):
+            f.write('%s %d\n' % (stack, samples))
+
+
+def summary(profile=PROFILE, limit=15):
+    lines = ['%-40s %14s' % ('counter', 'total')]
+    for name, value in sorted(profile.counters.items()):
+        lines.append('%-40s %14.3f' % (name, value))
+    for name, value in sorted(profile.gauges.items()):
+        lines.append('%-40s %14d' % (name, value))
+    for name, value in sorted(profile.calls.items()):
+        lines.append('%-40s %14d' % (name + ' calls', value))
+    leaves = Counter()
+    for stack, samples in profile.stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += samples
+    total = sum(leaves.values())
+    if total:
+        lines.append('')
+        lines.append('%-60s %8s' % ('self time', 'share'))
+        for name, samples in leaves.most_common(limit):
+            lines.append('%-60s %7.1f%%' % (name, 100.0 * samples / total))
+    return '\n'.join(lines)
+
+
+def finish():
+    stop_sampler()
+    if output is None:
+        return
+    if output == '1':
+        print(summary(), file=sys.stderr)
+        return
+    export_json(output + '.json')
+    export_csv(output + '.csv')
+    export_folded(output + '.folded')
+
+
+def enable(prefix='1'):
+    global ENABLED, output
+    if ENABLED:
+        return
+    ENABLED = True
+    output = prefix
+    start_sampler()
+    atexit.register(finish)
+
+
+if os.environ.get(ENVIRONMENT):
+    enable(os.environ[ENVIRONMENT])
@@ -1,74 +1,352 @@
 import random
+import time
 
 from copy import deepcopy
 
+import Instrumentation
+
+from util import add, div
+
 INF = 1000
+MAX_DEPTH = 64
 
-class Node:
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
 
-    def __init__(self, state, move):
-        self.state = deepcopy(state)
-        if move is not None:
-            self.state.perform_action(move)
-        self.moves = state.get_viable_moves()
-        self.children = {}
+class TranspositionTable:
+
+    # base is a read-only SearchStore.TableFile from earlier searches that
+    # answers probes the table itself misses
+    def __init__(self, size=1 << 18, base=None):
+        self.size = size
+        self.slots = [None] * size
+        self.base = base
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.base_hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return self.probe_base(key)
+
+    def probe_base(self, key):
+        if self.base is None:
+            return None
+        entry = self.base.probe(key)
+        if entry is not None:
+            self.hits += 1
+            self.base_hits += 1
+        return entry
+
+    def entries(self):
+        return (entry for entry in self.slots if entry is not None)
+
+    def store(self, key, depth, value, bound, move):
+        index = key % self.size
+        entry = self.slots[index]
+        if entry is not None:
+            # keep deeper results of the current search, let older ones age out
+            if entry[5] == self.generation and entry[1] > depth:
+                return
+            if entry[0] != key:
+                self.replacements += 1
+        self.stores += 1
+        self.slots[index] = (key, depth, value, bound, move, self.generation)
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes > 0 else 0.0
 
-    def expand(self):
-        for move in self.moves:
-            self.children[move] = Node(self.state, move)
+    def stats(self):
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate(),
+            'base_hits': self.base_hits,
+            'stores': self.stores,
+            'replacements': self.replacements,
+        }
+
+class SearchTimeout(Exception):
+    pass
+
+def is_forcing(state, move):
+    origin, destination = move
+    figure = state.get_field(origin)
+    if figure == 0 and destination[0] == state.board_size - 1:
+        return True
+    if figure == 1 and destination[0] == 0:
+        return True
+    if abs(origin[0] - destination[0]) == 2:
+        return state.get_field(div(add(origin, destination), 2)) > 1
+    return False
+
+def is_pseudo_legal(state, move):
+    # table moves are checked before they are played: a key collision, or an
+    # entry from another process or from disk, may belong to another position
+    origin, destination = move
+    figure = state.get_field(origin)
+    if figure is None or figure < 0 or figure % 2 != state.player or state.get_field(destination) != -1:
+        return False
+    rows, columns = destination[0] - origin[0], destination[1] - origin[1]
+    if abs(rows) != abs(columns) or abs(rows) not in (1, 2):
+        return False
+    if abs(rows) == 2:
+        captured = state.get_field(div(add(origin, destination), 2))
+        if captured is None or captured < 0 or captured % 2 == state.player:
+            return False
+        return state.only_viable_field is None or state.only_viable_field == origin
+    if state.only_viable_field is not None or figure < 2 and (rows > 0) != (state.player == 0):
+        return False
+    return not state.has_jumps()
+
+class MoveOrdering:
+
+    def __init__(self, killer_slots=2):
+        self.killer_slots = killer_slots
+        self.killers = {}
+        self.history = {}
+        self.cutoffs = 0
+
+    def new_search(self):
+        self.killers = {}
+        for move in self.history:
+            self.history[move] //= 2
+
+    def order(self, state, moves, depth, first_move):
+        killers = self.killers.get(depth, ())
+        history = self.history
+        def score(move):
+            if move == first_move:
+                return 1 << 30
+            result = history.get(move, 0)
+            if is_forcing(state, move):
+                result += 1 << 24
+            if move in killers:
+                result += 1 << 20
+            return result
+        return sorted(moves, key=score, reverse=True)
+
+    def record_cutoff(self, depth, move, remaining):
+        self.cutoffs += 1
+        killers = self.killers.setdefault(depth, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.killer_slots:]
+        self.history[move] = self.history.get(move, 0) + remaining * remaining
 
 class Minimax:
 
-    def __init__(self, state, depth):
-        self.state = state
+    # Depth-first alpha-beta over a single board with make/unmake. Only the
+    # current path and the principal variation are held, children are
+    # generated lazily once the hash move has failed to cut off.
+    def __init__(self, state, depth, table=None, deadline=None, ordering=None, evaluation=None,
+                 tablebase=None, stop=None):
+        self.state = deepcopy(state)
         self.max_depth = depth
+        self.table = table
+        self.deadline = deadline
+        self.stop = stop
+        self.ordering = MoveOrdering() if ordering is None else ordering
+        self.evaluation = heuristic_evaluation if evaluation is None else evaluation
+        self.tablebase = tablebase
+        self.nodes = 0
+        self.cutoffs = 0
+        self.principal_variation = []
 
-    def get_best_move(self):
-        _, move = self.evaluate_tree(1, Node(self.state, None), -INF, INF)
-        return move
-
-    def evaluate_tree(self, depth, node, alpha, beta):
-        if depth <= self.max_depth:
-            node.expand()
-        if node.state.player == 0: #maximizing
-            best_value, best_move = -INF, None
-            for move, child in node.children.items():
-                if best_move is None:
-                    best_move = move
-                if depth < self.max_depth:
-                    value, _ = self.evaluate_tree(depth+1, child, alpha, beta)
-                else:
-                    value = self.heuristic_evaluation(child.state)
-                if value > best_value:
-                    best_value, best_move = value, move
-                alpha = max(alpha, best_value)
-                if beta <= alpha:
-                    break
-            return best_value, best_move
-        else: #minimizing
-            best_value, best_move = INF, None
-            for move, child in node.children.items():
-                if depth < self.max_depth:
-                    value, _ = self.evaluate_tree(depth+1, child, alpha, beta)
+    def get_best_move(self, principal_variation=None):
+        if self.table is not None:
+            self.table.new_search()
+        _, variation = self.evaluate_tree(1, -INF, INF, principal_variation)
+        self.principal_variation = variation
+        return variation[0] if variation else None
+
+    def evaluate_child(self, depth, move, alpha, beta, principal_variation):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self.interrupted():
+            raise SearchTimeout()
+        record = self.state.perform_action(move)
+        value, variation = self.tablebase_value(), []
+        if value is None and depth < self.max_depth:
+            if principal_variation and principal_variation[0] == move:
+                principal_variation = principal_variation[1:]
+            else:
+                principal_variation = None
+            value, variation = self.evaluate_tree(depth+1, alpha, beta, principal_variation)
+        elif value is None:
+            value = self.heuristic_evaluation(self.state)
+        self.state.undo_action(record)
+        return value, variation
+
+    def interrupted(self):
+        # stop is a shared flag set by another process, see ParallelMinimax
+        if self.stop is not None and self.stop.value:
+            return True
+        return self.deadline is not None and time.perf_counter() > self.deadline
+
+    def evaluate_horizon(self, moves):
+        # every child is a leaf, so score them with one batched evaluation
+        values, masks, players, pending = [None] * len(moves), [], [], []
+        for index, move in enumerate(moves):
+            self.nodes += 1
+            if self.nodes & 255 == 0 and self.interrupted():
+                raise SearchTimeout()
+            record = self.state.perform_action(move)
+            values[index] = self.tablebase_value()
+            if values[index] is None:
+                masks.append(self.state.get_masks())
+                players.append(self.state.player)
+                pending.append(index)
+            self.state.undo_action(record)
+        if pending:
+            for index, value in zip(pending, self.evaluation.evaluate_batch(masks, players)):
+                values[index] = float(value)
+        return values
+
+    def staged_moves(self, depth, first_move):
+        # when the hash move cuts off the remaining moves are never generated
+        # or sorted
+        if first_move is not None and not is_pseudo_legal(self.state, first_move):
+            first_move = None
+        if first_move is not None:
+            yield first_move
+        for move in self.ordering.order(self.state, self.state.get_viable_moves(), depth, first_move):
+            if move != first_move:
+                yield move
+
+    def evaluate_tree(self, depth, alpha, beta, principal_variation=None):
+        if Instrumentation.ENABLED:
+            Instrumentation.sample('minimax.evaluate_tree')
+        key, remaining = self.state.hash, self.max_depth - depth + 1
+        first_move = None
+        if principal_variation:
+            first_move = principal_variation[0]
+        if self.table is not None:
+            entry = self.table.probe(key)
+            if entry is not None and first_move is None:
+                first_move = entry[4]
+            if entry is not None and depth > 1 and entry[1] >= remaining:
+                _, _, value, bound, move, _ = entry
+                if bound == EXACT:
+                    return value, []
+                if bound == LOWER_BOUND:
+                    alpha = max(alpha, value)
                 else:
-                    value = self.heuristic_evaluation(child.state)
-                if value < best_value:
-                    best_value, best_move = value, move
-                alpha = min(alpha, best_value)
+                    beta = min(beta, value)
                 if beta <= alpha:
-                    break
-            return best_value, best_move
+                    return value, []
+        original_alpha, original_beta = alpha, beta
+        horizon = None
+        if depth == self.max_depth and hasattr(self.evaluation, 'evaluate_batch'):
+            moves = self.ordering.order(self.state, self.state.get_viable_moves(), depth, first_move)
+            horizon = self.evaluate_horizon(moves)
+        else:
+            moves = self.staged_moves(depth, first_move)
+        maximizing = self.state.player == 0
+        best_value, best_move, variation = -INF if maximizing else INF, None, []
+        for index, move in enumerate(moves):
+            if horizon is None:
+                value, line = self.evaluate_child(depth, move, alpha, beta, principal_variation)
+            else:
+                value, line = horizon[index], []
+            if best_move is None or (value > best_value if maximizing else value < best_value):
+                best_value, best_move, variation = value, move, [move] + line
+            if maximizing:
+                alpha = max(alpha, best_value)
+            else:
+                beta = min(beta, best_value)
+            if beta <= alpha:
+                self.record_cutoff(depth, move, remaining)
+                break
+        if self.table is not None:
+            if best_value <= original_alpha:
+                bound = UPPER_BOUND
+            elif best_value >= original_beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            self.table.store(key, remaining, best_value, bound, best_move)
+        return best_value, variation
+
+    def tablebase_value(self):
+        if self.tablebase is None:
+            return None
+        outcome = self.tablebase.probe(self.state)
+        if outcome is None:
+            return None
+        winner, distance = outcome
+        if winner is None:
+            return 0
+        # prefer quick wins and slow losses
+        return INF - 1 - distance if winner == 0 else distance + 1 - INF
+
+    def record_cutoff(self, depth, move, remaining):
+        self.cutoffs += 1
+        self.ordering.record_cutoff(depth, move, remaining)
 
     def heuristic_evaluation(self, state):
-        maxi, mini = 0, 0
-        for i in range(state.board_size):
-            for j in range(state.board_size):
-                f = state.get_field((i, j))
-                if f >= 0:
-                    if f % 2 == 0:
-                        maxi += f + 3
-                    else:
-                        mini += f + 2
-        maxi += random.randint(0, 1)
-        mini += random.randint(0, 1)
-        return maxi - mini
+        return self.evaluation(state)
+
+
+def mobility(state):
+    moves = len(state.get_viable_moves())
+    return moves if state.player == 0 else -moves
+
+
+class Evaluation:
+
+    def __init__(self, pawn=3, king=5, advancement=0, back_rank=0, mobility=0, noise=1):
+        self.pawn = pawn
+        self.king = king
+        self.advancement = advancement
+        self.back_rank = back_rank
+        self.mobility = mobility
+        self.noise = noise
+
+    def __call__(self, state):
+        figures = state.figures
+        value = self.pawn * (figures[0] - figures[1]) + self.king * (figures[2] - figures[3])
+        if self.advancement:
+            value += self.advancement * (state.advancement[0] - state.advancement[1])
+        if self.back_rank:
+            value += self.back_rank * (state.back_rank[0] - state.back_rank[1])
+        if self.mobility:
+            value += self.mobility * mobility(state)
+        if self.noise:
+            value += random.randint(0, self.noise) - random.randint(0, self.noise)
+        return value
+
+
+heuristic_evaluation = Evaluation()
+
+EVALUATIONS = {
+    'material': heuristic_evaluation,
+    'positional': Evaluation(advancement=0.2, back_rank=0.5),
+    'mobility': Evaluation(advancement=0.2, back_rank=0.5, mobility=0.1),
+}
+
+def iterative_deepening(state, max_depth, deadline, table=None, ordering=None, evaluation=None,
+                        tablebase=None):
+    best_move, reached, nodes, principal_variation = None, 0, 0, None
+    for depth in range(1, max_depth + 1):
+        # the first iteration always completes so there is a move to return
+        decider = Minimax(state, depth, table, deadline if depth > 1 else None, ordering, evaluation,
+                          tablebase)
+        try:
+            move = decider.get_best_move(principal_variation)
+        except SearchTimeout:
+            nodes += decider.nodes
+            break
+        nodes += decider.nodes
+        best_move, reached, principal_variation = move, depth, decider.principal_variation
+        if time.perf_counter() >= deadline:
+            break
+    return best_move, reached, nodes
@@ -1,125 +1,396 @@
+import math
 import random
 
-import numpy as np
-
 from copy import deepcopy
 
+import Instrumentation
+import Minimax
+
+HEURISTIC_EPSILON = 0.1
+
+
+def random_policy(state, moves, rng):
+    return moves[rng.randint(0, len(moves)-1)]
+
+
+def capture_first_policy(state, moves, rng):
+    # ordinary captures are already mandatory, so favour king captures and promotions
+    forcing = [move for move in moves if Minimax.is_forcing(state, move)]
+    return random_policy(state, forcing if len(forcing) > 0 else moves, rng)
+
+
+def heuristic_policy(state, moves, rng):
+    if rng.random() < HEURISTIC_EPSILON:
+        return random_policy(state, moves, rng)
+    sign = 1 if state.player == 0 else -1
+    best_move, best_value = None, None
+    for move in moves:
+        record = state.perform_action(move)
+        value = sign * Minimax.heuristic_evaluation(state)
+        state.undo_action(record)
+        if best_value is None or value > best_value:
+            best_move, best_value = move, value
+    return best_move
+
+
+ROLLOUT_POLICIES = {
+    'random': random_policy,
+    'capture_first': capture_first_policy,
+    'heuristic': heuristic_policy,
+}
+
+
+def rollout(state, policy=random_policy, rng=random, tablebase=None, played=None):
+    records, outcome = [], None
+    while True:
+        if tablebase is not None:
+            outcome = tablebase.probe(state)
+            if outcome is not None:
+                break
+        moves = state.get_viable_moves()
+        if len(moves) == 0 or state.game_ended:
+            break
+        move = policy(state, moves, rng)
+        if played is not None:
+            played.append((state.player, move))
+        records.append(state.perform_action(move))
+    winner = state.get_winner() if outcome is None else outcome[0]
+    for record in reversed(records):
+        state.undo_action(record)
+    return winner, len(records)
+
+def outcome_value(winner):
+    return 0.5 if winner is None else 1.0 - winner
+
 class Node:
 
+    # proven is the exact score of player 0 once the solver has settled it,
+    # amaf_* count simulations in which this node's move was played later on
+    __slots__ = ('parent', 'player', 'moves', 'child_moves', 'children', 'wins', 'visits', 'proven',
+                 'amaf_wins', 'amaf_visits')
+
     def __init__(self, parent):
         self.parent = parent
-        self.children = {}
+        self.player = None
         self.moves = None
-        self.visited_children = 0
-        self.visited = False
+        self.child_moves = []
+        self.children = []
         self.wins = 0
         self.visits = 0
+        self.proven = None
+        self.amaf_wins = 0
+        self.amaf_visits = 0
 
     def try_set_moves(self, state):
         self.player = state.player
         if self.moves is None:
             self.moves = state.get_viable_moves()
 
-    def rollout_policy(self):
-        if len(self.moves) == 0:
-            return None
-        return self.moves[random.randint(0, len(self.moves)-1)]
+    def expand(self):
+        for move in self.moves:
+            if move not in self.child_moves:
+                return move, self.add_child(move)
+        return None, None
 
-    def expand(self, state):
-        self.try_set_moves(state)
-        if len(self.moves) > len(self.children):
-            for move in self.moves:
-                if move not in self.children:
-                    self.children[move] = Node(self)
+    def add_child(self, move):
+        child = Node(self)
+        self.child_moves.append(move)
+        self.children.append(child)
+        return child
+
+    def get_child(self, move):
+        for i in range(len(self.child_moves)):
+            if self.child_moves[i] == move:
+                return self.children[i]
+        return None
 
     def is_fully_expanded(self):
-        return self.moves is not None and len(self.children) == self.visited_children
+        return self.moves is not None and len(self.children) == len(self.moves)
 
-    def UCT(self):
+    def UCT(self, equivalence=0):
         exploitation = self.wins / self.visits
-        exploration = np.sqrt(2 * np.log(self.parent.visits) / self.visits)
+        if equivalence and self.amaf_visits:
+            # RAVE: lean on the AMAF average while the node has few visits
+            beta = math.sqrt(equivalence / (3 * self.visits + equivalence))
+            exploitation += beta * (self.amaf_wins / self.amaf_visits - exploitation)
+        exploration = math.sqrt(2 * math.log(self.parent.visits) / self.visits)
         return exploitation + exploration
 
-    def get_best_move(self):
+    def select_child(self, equivalence=0, solver=False):
+        exploration = 2 * math.log(self.visits)
+        sqrt = math.sqrt
+        best_index, best_UCT = 0, -1.0
+        if not equivalence and not solver:
+            for i, child in enumerate(self.children):
+                visits = child.visits
+                value = child.wins / visits + sqrt(exploration / visits)
+                if value > best_UCT:
+                    best_index, best_UCT = i, value
+            return self.child_moves[best_index], self.children[best_index]
+        # a child proven lost for the player to move is never entered again
+        lost = self.player if solver else None
+        for i, child in enumerate(self.children):
+            if lost is not None and child.proven == lost:
+                continue
+            visits = child.visits
+            value = child.wins / visits
+            if equivalence and child.amaf_visits:
+                beta = sqrt(equivalence / (3 * visits + equivalence))
+                value += beta * (child.amaf_wins / child.amaf_visits - value)
+            value += sqrt(exploration / visits)
+            if value > best_UCT:
+                best_index, best_UCT = i, value
+        return self.child_moves[best_index], self.children[best_index]
+
+    def get_best_move(self, solver=False):
+        candidates = list(zip(self.child_moves, self.children))
+        if solver and self.player is not None:
+            won, lost = 1 - self.player, self.player
+            for move, child in candidates:
+                if child.proven == won:
+                    return move
+            candidates = [(move, child) for move, child in candidates if child.proven != lost] or candidates
         result, max_visits = None, 0
-        for move, child in self.children.items():
+        for move, child in candidates:
             if child.visits >= max_visits:
                 max_visits = child.visits
                 result = move
         return result
 
-    def visit(self, state):
-        self.expand(state)
-        if not self.visited:
-            self.visited = True
-            if self.parent is not None:
-                self.parent.visited_children += 1
-
 class Tree:
 
-    def __init__(self):
+    def __init__(self, rollout_policy=random_policy, tablebase=None, solver=False, rave=0, prior=None):
+        self.rollout_policy = rollout_policy
+        self.tablebase = tablebase
+        # a SearchStore.TreeFile whose statistics seed nodes on their first visit
+        self.prior = prior
+        self.solver = solver
+        # equivalence parameter of the RAVE schedule, 0 turns AMAF off
+        self.rave = rave
+        self.played = None
         self.root = Node(None)
-        self.original_root = self.root
+        self.working_state = None
 
     def set_game(self, game):
-        self.root = self.original_root
-        self.state = game.state
+        self.root = Node(None)
+        self.set_state(game.state)
+
+    def set_state(self, state):
+        self.state = state
+        self.working_state = None
 
     def advance_root(self, move):
-        if move not in self.root.children:
-            self.root.children[move] = Node(self.root)
-        self.root = self.root.children[move]
+        child = self.root.get_child(move)
+        self.set_root(Node(None) if child is None else child)
+
+    def set_root(self, root):
+        # detach the new root so the rest of the old tree can be freed
+        root.parent = None
+        self.root = root
+        self.working_state = None
 
     def perform_iteration(self):
-        tmp_state = deepcopy(self.state)
-        leaf = self.search(tmp_state)
-        leaf.visit(tmp_state)
-        node, winner = self.playout(leaf, tmp_state)
-        self.backpropagate(node, winner)
+        if Instrumentation.ENABLED:
+            Instrumentation.sample('mcts.perform_iteration')
+        leaf, records = self.select()
+        if leaf.proven is not None:
+            value, length = leaf.proven, 0
+            self.backpropagate_value(leaf, value)
+        else:
+            winner, length = self.playout()
+            value = outcome_value(winner)
+            self.backpropagate(leaf, winner)
+        if self.rave:
+            self.update_amaf(leaf, value, self.played, len(records))
+        self.unwind(records)
+        return length
+
+    def perform_batch(self, evaluate, size):
+        # scores up to size leaves with one call to evaluate(masks, players),
+        # which returns player 0's expected score; a virtual visit on each
+        # selected path steers the following selections elsewhere
+        leaves, values, masks, players, paths = [], [], [], [], []
+        for i in range(size):
+            leaf, records = self.select()
+            state = self.working_state
+            outcome = None
+            if self.tablebase is not None and leaf.proven is None:
+                outcome = self.tablebase.probe(state)
+            if leaf.proven is not None:
+                values.append(leaf.proven)
+            elif outcome is not None:
+                values.append(outcome_value(outcome[0]))
+            elif state.game_ended or len(leaf.moves) == 0:
+                values.append(outcome_value(state.get_winner()))
+            else:
+                values.append(None)
+                masks.append(state.get_masks())
+                players.append(state.player)
+            self.backpropagate_value(leaf, None)
+            self.unwind(records)
+            leaves.append(leaf)
+            paths.append((self.played, len(records)))
+        scores = iter(evaluate(masks, players) if masks else ())
+        for leaf, value, (played, length) in zip(leaves, values, paths):
+            value = float(next(scores)) if value is None else value
+            self.backpropagate_value(leaf, value, 0)
+            if self.rave:
+                self.update_amaf(leaf, value, played, length)
+        return len(leaves)
+
+    def select(self):
+        if self.working_state is None:
+            self.working_state = deepcopy(self.state)
+        records = []
+        self.played = [] if self.rave else None
+        leaf = self.search(self.working_state, records, self.played)
+        return leaf, records
+
+    def unwind(self, records):
+        for record in reversed(records):
+            self.working_state.undo_action(record)
 
     def get_best_move(self):
-        return self.root.get_best_move()
+        return self.root.get_best_move(self.solver)
+
+    def is_decided(self, remaining_iterations):
+        if self.root.moves is not None and len(self.root.moves) == 1:
+            return True
+        if self.solver and self.root.proven is not None:
+            return True
+        first, second = 0, 0
+        for child in self.root.children:
+            if child.visits > first:
+                first, second = child.visits, first
+            elif child.visits > second:
+                second = child.visits
+        return first - second > remaining_iterations
+
+    def size(self):
+        result, stack = 0, [self.root]
+        while stack:
+            node = stack.pop()
+            result += 1
+            stack.extend(node.children)
+        return result
 
-    def search(self, state):
+    def search(self, state, records, played=None):
         curr = self.root
         while True:
-            curr.expand(state)
-            if not curr.visited:
+            fresh = curr.moves is None
+            curr.try_set_moves(state)
+            if fresh and self.prior is not None:
+                self.warm_start(curr, state)
+            unseen = fresh or curr.visits == 0
+            if self.solver and (curr.proven is not None or unseen and self.prove(curr, state)):
                 return curr
-            if len(curr.children) == 0:
+            if len(curr.moves) == 0:
                 return curr
-            if curr.is_fully_expanded():
-                best_child, best_move, best_UCT = None, None, 0
-                for move, child in curr.children.items():
-                    if child.UCT() > best_UCT:
-                        best_UCT = child.UCT()
-                        best_child = child
-                        best_move = move
-                state.perform_action(best_move)
-                curr = best_child
+            if not curr.is_fully_expanded():
+                move, child = curr.expand()
             else:
-                for move, child in curr.children.items():
-                    if not child.visited:
-                        state.perform_action(move)
-                        return child
+                move, child = curr.select_child(self.rave, self.solver)
+            if played is not None:
+                played.append((curr.player, move))
+            records.append(state.perform_action(move))
+            if child.visits == 0:
+                child.try_set_moves(state)
+                if self.prior is not None:
+                    self.warm_start(child, state)
+                if self.solver:
+                    self.prove(child, state)
+                return child
+            curr = child
 
-    def playout(self, node, state):
-        while True:
-            node.expand(state)
-            move = node.rollout_policy()
-            if move is None:
-                #winner = 1 if state.get_winner() == self.state.player else 0
-                winner = state.get_winner()
-                return node, winner
+    def warm_start(self, node, state):
+        # children start with the visits and wins of an earlier search of the
+        # same position, the node's own count is raised to their total
+        visits, wins, proven = 0, 0.0, False
+        for move, child_visits, child_wins, child_proven in self.prior.entries(state.hash):
+            if move not in node.moves or node.get_child(move) is not None:
+                continue
+            child = node.add_child(move)
+            child.visits, child.wins = child_visits, child_wins
+            visits += child_visits
+            wins += child_wins
+            if self.solver and child_proven is not None:
+                child.proven, proven = child_proven, True
+        if visits > node.visits:
+            if node.visits > 0:
+                node.wins *= visits / node.visits
+            elif node.parent is not None:
+                # reached by a new path, so value it from its children
+                value = wins / visits
+                node.wins = visits * (value if node.parent.player == node.player else 1 - value)
+            node.visits = visits
+        if proven:
+            self.propagate_proof(node)
+
+    def prove(self, node, state):
+        # terminal and tablebase positions have exact values
+        if len(node.moves) == 0 or state.game_ended:
+            node.proven = outcome_value(state.get_winner())
+        elif self.tablebase is not None:
+            outcome = self.tablebase.probe(state)
+            if outcome is not None:
+                node.proven = outcome_value(outcome[0])
+        if node.proven is None:
+            return False
+        self.propagate_proof(node.parent)
+        return True
+
+    def propagate_proof(self, node):
+        # a node is won once any move wins for the player to move there, and
+        # settled by its best move once every move is proven
+        while node is not None and node.proven is None:
+            won = 1 - node.player
+            values = [child.proven for child in node.children]
+            if won in values:
+                node.proven = won
+            elif node.is_fully_expanded() and None not in values:
+                node.proven = max(values) if node.player == 0 else min(values)
             else:
-                state.perform_action(move)
-                node = node.children[move]
+                return
+            node = node.parent
+
+    def update_amaf(self, leaf, value, played, path_length):
+        # all moves as first: a child's move shares the result of every
+        # simulation in which the same player made it somewhere below
+        later = set(played[path_length:])
+        node, index = leaf, path_length
+        while True:
+            if node.children:
+                reward = value if node.player == 0 else 1 - value
+                for move, child in zip(node.child_moves, node.children):
+                    if (node.player, move) in later:
+                        child.amaf_visits += 1
+                        child.amaf_wins += reward
+            if node.parent is None or node == self.root:
+                return
+            index -= 1
+            later.add(played[index])
+            node = node.parent
+
+    def playout(self):
+        return rollout(self.working_state, self.rollout_policy, tablebase=self.tablebase, played=self.played)
+
+    def backpropagate_value(self, node, value, visits=1):
+        while True:
+            node.visits += visits
+            if node.parent is None or node == self.root:
+                return
+            if value is not None:
+                node.wins += value if node.parent.player == 0 else 1 - value
+            node = node.parent
 
     def backpropagate(self, node, winner):
         while True:
             node.visits += 1
-            node.wins += 1 if node.player != winner else 0
-            #node.wins += winner
             if node.parent is None or node == self.root:
                 return
+            # wins are counted for the player who moved into the node
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.parent.player:
+                node.wins += 1
             node = node.parent
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from copy import deepcopy
+
+
+class MoveCache:
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'evictions': self.evictions,
+        }
+
+
+def copy_sharing_cache(state, memo):
+    # positions are keyed by hash, so copies of a state can share one cache
+    result = state.__class__.__new__(state.__class__)
+    memo[id(state)] = result
+    for key, value in state.__dict__.items():
+        result.__dict__[key] = value if key == 'move_cache' else deepcopy(value, memo)
+    return result
+
+
+def state_without_cache(state):
+    result = state.__dict__.copy()
+    result['move_cache'] = None
+    return result
@@ -0,0 +1,70 @@
+import struct
+
+import numpy as np
+
+import Zobrist
+
+from EntryTable import find_entries, read_entries, write_entries
+
+MAGIC = b'CKBOOK01'
+HEADER = struct.Struct('<8sII')
+# score counts half points for the side that played the move
+ENTRY = np.dtype([('key', '<u8'), ('move', '<u2'), ('games', '<u4'), ('score', '<u4')])
+
+
+def encode_move(move):
+    return Zobrist.square(move[0]) * Zobrist.SQUARES + Zobrist.square(move[1])
+
+
+def decode_move(code):
+    origin, destination = divmod(code, Zobrist.SQUARES)
+    return (Zobrist.FIELDS[origin], Zobrist.FIELDS[destination])
+
+
+def collect(results, plies=16, statistics=None):
+    statistics = {} if statistics is None else statistics
+    for result in results:
+        winner = result['winner']
+        for position, player, move in result['moves'][:plies]:
+            score = 1 if winner is None else 2 * (winner == player)
+            entry = statistics.setdefault((position, encode_move(move)), [0, 0])
+            entry[0] += 1
+            entry[1] += score
+    return statistics
+
+
+def write(path, statistics, load_factor=0.5):
+    rows = [(key, move, games, score) for (key, move), (games, score) in statistics.items()]
+    write_entries(path, HEADER, (MAGIC,), ENTRY, rows, load_factor)
+
+
+class OpeningBook:
+
+    def __init__(self, path, min_games=2):
+        self.path = path
+        self.min_games = min_games
+        self.table, self.size, _ = read_entries(path, HEADER, MAGIC, ENTRY, 'an opening book')
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        return self.path, self.min_games
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def entries(self, key):
+        for entry_key, move, games, score in find_entries(self.table, key, 'games'):
+            yield decode_move(move), games, score
+
+    def probe(self, state):
+        best_move, best_rank = None, None
+        for move, games, score in self.entries(state.hash):
+            rank = (score / games, games)
+            if games >= self.min_games and (best_rank is None or rank > best_rank):
+                best_move, best_rank = move, rank
+        if best_move is None or best_move not in state.get_viable_moves():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return best_move
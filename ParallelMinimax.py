@@ -0,0 +1,202 @@
+import ctypes
+import multiprocessing
+import random
+import time
+
+import Minimax
+
+from OpeningBook import decode_move, encode_move
+
+NO_MOVE = 0xFFFF
+
+
+class SharedTranspositionTable(Minimax.TranspositionTable):
+
+    # Lockless table in shared memory. A slot is three words: the key xor-ed
+    # with the other two, depth/bound/move/generation packed into one word,
+    # and the value as a double. A slot torn by two processes storing at once
+    # fails the key check and reads as a miss. The last word is the search
+    # generation, so every process ages entries the same way.
+    def __init__(self, size=1 << 18, base=None):
+        self.size = size
+        # ctypes type, the 'Q' typecode needs Python 3.7
+        self.array = multiprocessing.RawArray(ctypes.c_uint64, 3 * size + 1)
+        self.attach()
+        self.base = base
+        self.probes = 0
+        self.hits = 0
+        self.base_hits = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def attach(self):
+        view = memoryview(self.array).cast('B')
+        self.words = view.cast('Q')
+        self.doubles = view.cast('d')
+
+    def __getstate__(self):
+        result = self.__dict__.copy()
+        del result['words'], result['doubles']
+        return result
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach()
+
+    @property
+    def generation(self):
+        return self.words[3 * self.size]
+
+    def new_search(self):
+        self.words[3 * self.size] = (self.generation + 1) & 0xFFFF
+
+    def probe(self, key):
+        self.probes += 1
+        index = 3 * (key % self.size)
+        words = self.words
+        data, value = words[index + 1], self.doubles[index + 2]
+        if data == 0 or words[index] ^ data ^ words[index + 2] != key:
+            return self.probe_base(key)
+        self.hits += 1
+        return self.unpack(key, data, value)
+
+    def unpack(self, key, data, value):
+        move = data >> 10 & 0xFFFF
+        return (key, data & 0xFF, value, data >> 8 & 3, None if move == NO_MOVE else decode_move(move),
+                data >> 26)
+
+    def entries(self):
+        words, doubles = self.words, self.doubles
+        for index in range(0, 3 * self.size, 3):
+            data = words[index + 1]
+            if data != 0:
+                yield self.unpack(words[index] ^ data ^ words[index + 2], data, doubles[index + 2])
+
+    def store(self, key, depth, value, bound, move):
+        index = 3 * (key % self.size)
+        words = self.words
+        data, generation = words[index + 1], self.generation
+        if data != 0:
+            if data >> 26 == generation and data & 0xFF > depth:
+                return
+            if words[index] ^ data ^ words[index + 2] != key:
+                self.replacements += 1
+        self.stores += 1
+        data = depth | bound << 8 | (NO_MOVE if move is None else encode_move(move)) << 10 | generation << 26
+        self.doubles[index + 2] = value
+        words[index + 1] = data
+        words[index] = key ^ data ^ words[index + 2]
+
+
+table = None
+stop = None
+ordering = None
+
+
+def initialize(shared_table, shared_stop):
+    global table, stop, ordering
+    table, stop, ordering = shared_table, shared_stop, Minimax.MoveOrdering()
+
+
+def table_counters(shared_table=None):
+    shared_table = table if shared_table is None else shared_table
+    return [shared_table.probes, shared_table.hits, shared_table.base_hits, shared_table.stores,
+            shared_table.replacements]
+
+
+def search_worker(args):
+    state, depth, time_limit, evaluation, tablebase, seed, helper = args
+    random.seed(seed)
+    ordering.new_search()
+    start = time.perf_counter()
+    deadline = None if time_limit is None else start + time_limit
+    counters, cutoffs = table_counters(), ordering.cutoffs
+    best_move, reached, nodes = None, 0, 0
+    if helper == 0:
+        # the main search is exactly the serial one, so one worker is deterministic
+        if time_limit is None:
+            decider = Minimax.Minimax(state, depth, table, ordering=ordering, evaluation=evaluation,
+                                      tablebase=tablebase)
+            best_move, reached, nodes = decider.get_best_move(), depth, decider.nodes
+        else:
+            best_move, reached, nodes = Minimax.iterative_deepening(
+                state, depth, deadline, table, ordering, evaluation, tablebase)
+        stop.value = 1
+    else:
+        # helpers fill the shared table, odd ones start a ply later so their
+        # iterations do not march in step with the main search; none goes past
+        # the requested depth, so a fixed-depth move never depends on workers
+        for current in range(1 + helper % 2, depth + 1):
+            decider = Minimax.Minimax(state, current, table, deadline, ordering, evaluation, tablebase,
+                                      stop)
+            try:
+                move = decider.get_best_move()
+            except Minimax.SearchTimeout:
+                nodes += decider.nodes
+                break
+            nodes += decider.nodes
+            best_move, reached = move, current
+    return {
+        'helper': helper,
+        'move': best_move,
+        'depth': reached,
+        'nodes': nodes,
+        'cutoffs': ordering.cutoffs - cutoffs,
+        'table': [now - before for now, before in zip(table_counters(), counters)],
+    }
+
+
+class LazySMPSearch:
+
+    # Lazy SMP: every worker searches the whole tree from the root and they
+    # share bounds only through the transposition table. The deepest finished
+    # iteration wins, ties go to the main search.
+    def __init__(self, workers=None, table_size=1 << 18):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.table = SharedTranspositionTable(table_size)
+        self.stop = multiprocessing.RawValue('b', 0)
+        self.pool = None
+        self.cutoffs = 0
+        self.stats = {}
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers, initialize, (self.table, self.stop))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __getstate__(self):
+        result = self.__dict__.copy()
+        result['pool'] = None
+        return result
+
+    def search(self, state, depth, time_limit, evaluation, tablebase=None):
+        self.stop.value = 0
+        if depth is None:
+            depth = Minimax.MAX_DEPTH
+        # the main search is submitted first so a helper never holds up its process
+        tasks = [(state, depth, time_limit, evaluation, tablebase, random.getrandbits(32), helper)
+                 for helper in range(self.workers)]
+        results = self.get_pool().map(search_worker, tasks, chunksize=1)
+        best = results[0]
+        for result in results[1:]:
+            if result['move'] is not None and result['depth'] > best['depth']:
+                best = result
+        nodes = sum(result['nodes'] for result in results)
+        self.cutoffs += sum(result['cutoffs'] for result in results)
+        counters = table_counters(self.table)
+        for result in results:
+            counters = [total + delta for total, delta in zip(counters, result['table'])]
+        (self.table.probes, self.table.hits, self.table.base_hits, self.table.stores,
+         self.table.replacements) = counters
+        self.stats = {
+            'workers': self.workers,
+            'main_nodes': results[0]['nodes'],
+            'helper_nodes': nodes - results[0]['nodes'],
+            'helper_move': best['helper'] != 0,
+        }
+        return best['move'], best['depth'], nodes
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+import time
+
+import MonteCarloTreeSearch
+
+
+def search_root(args):
+    state, max_iterations, time_limit, rollout_policy, tablebase, solver, rave, prior, seed = args
+    random.seed(seed)
+    tree = MonteCarloTreeSearch.Tree(rollout_policy, tablebase, solver, rave, prior)
+    tree.set_state(state)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    iterations, rollout_steps = 0, 0
+    while max_iterations is None or iterations < max_iterations:
+        if deadline is not None and time.perf_counter() >= deadline:
+            break
+        rollout_steps += tree.perform_iteration()
+        iterations += 1
+        if solver and tree.root.proven is not None:
+            break
+    children = {move: (child.visits, child.wins, child.proven)
+                for move, child in zip(tree.root.child_moves, tree.root.children)}
+    return iterations, rollout_steps, children
+
+
+def run_playouts(args):
+    state, count, rollout_policy, tablebase, record_moves, seed = args
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        # RAVE needs the moves of every rollout
+        played = [] if record_moves else None
+        winner, length = MonteCarloTreeSearch.rollout(state, rollout_policy, rng, tablebase, played)
+        results.append((winner, length, played))
+    return results
+
+
+class ParallelSearch:
+
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def __getstate__(self):
+        result = self.__dict__.copy()
+        result['pool'] = None
+        return result
+
+
+class RootParallelSearch(ParallelSearch):
+
+    def search(self, state, max_iterations, time_limit, rollout_policy, tablebase=None, solver=False, rave=0,
+               prior=None):
+        per_worker = None
+        if max_iterations is not None:
+            per_worker = -(-max_iterations // self.workers)
+        tasks = [(state, per_worker, time_limit, rollout_policy, tablebase, solver, rave, prior,
+                  random.getrandbits(32)) for i in range(self.workers)]
+        totals, proofs, iterations, rollout_steps = {}, {}, 0, 0
+        for worker_iterations, worker_steps, children in self.get_pool().map(search_root, tasks):
+            iterations += worker_iterations
+            rollout_steps += worker_steps
+            for move, (visits, wins, proven) in children.items():
+                total = totals.setdefault(move, [0, 0])
+                total[0] += visits
+                total[1] += wins
+                if proven is not None:
+                    proofs[move] = proven
+        # as in Node.get_best_move, a proven win is played at once and proven
+        # losses only when nothing else is left
+        won, lost = 1 - state.player, state.player
+        for move, proven in proofs.items():
+            if proven == won:
+                return move, iterations, rollout_steps
+        candidates = [move for move in totals if proofs.get(move) != lost] or list(totals)
+        best_move, max_visits = None, -1
+        for move in candidates:
+            if totals[move][0] > max_visits:
+                best_move, max_visits = move, totals[move][0]
+        return best_move, iterations, rollout_steps
+
+
+class LeafParallelSearch(ParallelSearch):
+
+    def __init__(self, workers=None, batch_size=None):
+        super(LeafParallelSearch, self).__init__(workers)
+        self.batch_size = batch_size or 4 * self.workers
+
+    def perform_iteration(self, tree):
+        leaf, records = tree.select()
+        path, path_length = tree.played, len(records)
+        if leaf.proven is not None:
+            # a solved leaf needs no playouts
+            tree.backpropagate_value(leaf, leaf.proven)
+            if tree.rave:
+                tree.update_amaf(leaf, leaf.proven, path, path_length)
+            tree.unwind(records)
+            return 1, 0
+        counts = [self.batch_size // self.workers] * self.workers
+        for i in range(self.batch_size % self.workers):
+            counts[i] += 1
+        tasks = [(tree.working_state, count, tree.rollout_policy, tree.tablebase, bool(tree.rave),
+                  random.getrandbits(32)) for count in counts if count > 0]
+        playouts, rollout_steps = 0, 0
+        for results in self.get_pool().map(run_playouts, tasks):
+            for winner, length, played in results:
+                tree.backpropagate(leaf, winner)
+                if tree.rave:
+                    tree.update_amaf(leaf, MonteCarloTreeSearch.outcome_value(winner), path + played,
+                                     path_length)
+                playouts += 1
+                rollout_steps += length
+        tree.unwind(records)
+        return playouts, rollout_steps
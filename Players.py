@@ -40,48 +40,244 @@ class ManualPlayer(GamePlayer):
         pass
 
 
+import time
+
 import MonteCarloTreeSearch
+import ParallelMonteCarloTreeSearch
+import Pondering
+import ValueModel
+
+def play_book_move(player, state):
+    if player.book is None:
+        return None
+    move = player.book.probe(state)
+    if move is not None:
+        player.stats = {'book': True}
+        state.perform_action(move)
+    return move
+
 
 class MonteCarloPlayer(GamePlayer):
 
-    def __init__(self, max_iterations):
+    def __init__(self, max_iterations, time_limit=None, early_stop=False,
+                 parallel=None, workers=None, batch_size=None, rollout_policy='random', book=None,
+                 tablebase=None, value_model=None, ponder=False, solver=False, rave=0, stored_tree=None):
+        if max_iterations is None and time_limit is None:
+            raise ValueError("MonteCarloPlayer needs an iteration or time limit")
         self.max_iterations = max_iterations
-        self.tree = MonteCarloTreeSearch.Tree()
+        self.book = book
+        self.tablebase = tablebase
+        self.stored_tree = stored_tree
+        self.value_model = value_model
+        self.batch_size = batch_size
+        self.time_limit = time_limit
+        self.early_stop = early_stop
+        self.rollout_policy = MonteCarloTreeSearch.ROLLOUT_POLICIES[rollout_policy]
+        self.tree = MonteCarloTreeSearch.Tree(self.rollout_policy, solver=solver, rave=rave)
+        self.stats = {}
+        if parallel is None:
+            self.parallel = None
+        elif parallel == 'root':
+            self.parallel = ParallelMonteCarloTreeSearch.RootParallelSearch(workers)
+        elif parallel == 'leaf':
+            self.parallel = ParallelMonteCarloTreeSearch.LeafParallelSearch(workers, batch_size)
+        else:
+            raise ValueError("Unknown parallel mode: %s" % parallel)
+        if parallel is not None and value_model is not None:
+            raise ValueError("A value model replaces rollouts and cannot run in parallel")
+        if parallel is not None and ponder:
+            raise ValueError("Pondering grows the local tree and cannot run in parallel")
+        self.ponderer = Pondering.Ponderer(Pondering.ponder_tree) if ponder else None
+        self.ponder_stats = {}
 
     def set_game(self, game):
         super(MonteCarloPlayer, self).set_game(game)
+        self.tree.tablebase = self.tablebase
+        self.tree.prior = self.stored_tree
         self.tree.set_game(game)
 
     def take_turn(self, state):
-        for i in range(self.max_iterations):
-            self.tree.perform_iteration()
-        move = self.tree.get_best_move()
+        if len(state.get_viable_moves()) == 0:
+            return
+        move = play_book_move(self, state)
+        if move is not None:
+            return move
+        start = time.perf_counter()
+        if isinstance(self.parallel, ParallelMonteCarloTreeSearch.RootParallelSearch):
+            move, iterations, rollout_steps = self.parallel.search(
+                state, self.max_iterations, self.time_limit, self.rollout_policy, self.tablebase,
+                self.tree.solver, self.tree.rave, self.stored_tree)
+            tree_size = None
+        else:
+            iterations, rollout_steps = self.search(start)
+            move = self.tree.get_best_move()
+            tree_size = self.tree.size()
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            'iterations': iterations,
+            'time': elapsed,
+            'iterations_per_second': iterations / elapsed if elapsed > 0 else 0.0,
+            'rollout_steps': rollout_steps,
+            'average_rollout_length': rollout_steps / iterations if iterations > 0 else 0.0,
+            'tree_size': tree_size,
+        }
+        self.stats.update(self.ponder_stats)
+        self.ponder_stats = {}
         state.perform_action(move)
         return move
 
+    def search(self, start):
+        deadline = None if self.time_limit is None else start + self.time_limit
+        rounds, iterations, rollout_steps = 0, 0, 0
+        while self.max_iterations is None or iterations < self.max_iterations:
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                break
+            if self.value_model is not None:
+                playouts, steps = self.tree.perform_batch(
+                    self.value_model.evaluate_positions, self.batch_size or 16), 0
+            elif self.parallel is None:
+                playouts, steps = 1, self.tree.perform_iteration()
+            else:
+                playouts, steps = self.parallel.perform_iteration(self.tree)
+            rounds += 1
+            iterations += playouts
+            rollout_steps += steps
+            if self.early_stop and rounds % 16 == 0:
+                if self.tree.is_decided(self.remaining_iterations(iterations, start, now, deadline)):
+                    break
+        return iterations, rollout_steps
+
+    def remaining_iterations(self, iterations, start, now, deadline):
+        remaining = float('inf')
+        if self.max_iterations is not None:
+            remaining = self.max_iterations - iterations
+        if deadline is not None and now > start:
+            remaining = min(remaining, (deadline - now) * iterations / (now - start))
+        return remaining
+
     def move_made(self, move):
-        self.tree.advance_root(move)
+        if self.ponderer is not None and self.ponderer.active:
+            result = self.ponderer.stop(move)
+            self.tree.set_root(MonteCarloTreeSearch.Node(None) if result['root'] is None else result['root'])
+            self.ponder_stats = {'ponder_iterations': result['iterations'], 'ponder_hit': result['hit']}
+        else:
+            self.tree.advance_root(move)
+        if self.ponderer is not None and Pondering.opponent_to_move(self, move):
+            self.ponderer.start((self.game.state, self.tree.root, self.rollout_policy, self.tablebase,
+                                 self.tree.solver, self.tree.rave, self.stored_tree, self.value_model,
+                                 self.batch_size or 16, self.max_iterations, random.getrandbits(32)))
+
+    def close(self):
+        if self.ponderer is not None:
+            self.ponderer.close()
+        if self.parallel is not None:
+            self.parallel.close()
 
 
 import Minimax
+import ParallelMinimax
 
 class MinimaxPlayer(GamePlayer):
 
-    def __init__(self, depth):
+    def __init__(self, depth, table_size=1 << 18, time_limit=None, evaluation='material', book=None,
+                 tablebase=None, value_model=None, workers=None, ponder=False, stored_table=None):
         self.depth = depth
+        self.book = book
+        self.tablebase = tablebase
+        self.stored_table = stored_table
+        self.value_model = value_model
+        self.evaluation_name = evaluation
+        self.evaluation = Minimax.EVALUATIONS[evaluation]
+        self.ordering = Minimax.MoveOrdering()
+        if workers is not None:
+            self.parallel = ParallelMinimax.LazySMPSearch(workers, table_size)
+            self.table = self.parallel.table
+        elif ponder:
+            # the pondering process fills the same table
+            self.parallel = None
+            self.table = ParallelMinimax.SharedTranspositionTable(table_size)
+        else:
+            self.parallel = None
+            self.table = Minimax.TranspositionTable(table_size)
+        self.ponderer = Pondering.Ponderer(Pondering.ponder_search, self.table) if ponder else None
+        self.ponder_stats = {}
+        self.time_limit = time_limit
+        self.stats = {}
 
     def set_game(self, game):
         super(MinimaxPlayer, self).set_game(game)
         self.state = game.state
+        self.table.base = self.stored_table if self.matches_stored_table() else None
 
     def take_turn(self, state):
-        decider = Minimax.Minimax(state, self.depth)
-        move = decider.get_best_move()
+        if len(state.get_viable_moves()) == 0:
+            return
+        move = play_book_move(self, state)
+        if move is not None:
+            return move
+        start = time.perf_counter()
+        counter = self.ordering if self.parallel is None else self.parallel
+        cutoffs, probes, hits = counter.cutoffs, self.table.probes, self.table.hits
+        self.ordering.new_search()
+        evaluation = self.get_evaluation()
+        if self.parallel is not None:
+            move, depth, nodes = self.parallel.search(state, self.depth, self.time_limit, evaluation,
+                                                      self.tablebase)
+        elif self.time_limit is None:
+            decider = Minimax.Minimax(state, self.depth, self.table, ordering=self.ordering,
+                                      evaluation=evaluation, tablebase=self.tablebase)
+            move = decider.get_best_move()
+            depth, nodes = self.depth, decider.nodes
+        else:
+            max_depth = Minimax.MAX_DEPTH if self.depth is None else self.depth
+            move, depth, nodes = Minimax.iterative_deepening(
+                state, max_depth, start + self.time_limit, self.table, self.ordering, evaluation,
+                self.tablebase)
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            'depth': depth,
+            'nodes': nodes,
+            'cutoffs': counter.cutoffs - cutoffs,
+            'table_probes': self.table.probes - probes,
+            'table_hits': self.table.hits - hits,
+            'time': elapsed,
+            'nodes_per_second': nodes / elapsed if elapsed > 0 else 0.0,
+        }
+        if self.parallel is not None:
+            self.stats.update(self.parallel.stats)
+        self.stats.update(self.ponder_stats)
+        self.ponder_stats = {}
         state.perform_action(move)
         return move
 
+    def matches_stored_table(self):
+        # stored values are only comparable under the evaluation they came from
+        if self.stored_table is None or self.value_model is not None:
+            return False
+        return self.stored_table.evaluation == self.evaluation_name
+
+    def get_evaluation(self):
+        if self.value_model is not None:
+            return ValueModel.ModelEvaluation(self.value_model)
+        return self.evaluation
+
     def move_made(self, move):
-        pass
+        if self.ponderer is None:
+            return
+        if self.ponderer.active:
+            result = self.ponderer.stop(move)
+            self.ponder_stats = {'ponder_nodes': result['nodes'], 'ponder_hit': result['hit']}
+        if Pondering.opponent_to_move(self, move):
+            depth = Minimax.MAX_DEPTH if self.depth is None else self.depth
+            self.ponderer.start((self.game.state, depth, self.get_evaluation(), self.tablebase,
+                                 random.getrandbits(32)))
+
+    def close(self):
+        if self.ponderer is not None:
+            self.ponderer.close()
+        if self.parallel is not None:
+            self.parallel.close()
 
 
 class EnMassePlayer(GamePlayer):
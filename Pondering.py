@@ -0,0 +1,133 @@
+import multiprocessing
+import random
+
+import Minimax
+import MonteCarloTreeSearch
+
+
+def serve(connection, parent, stop, handler, arguments):
+    # without the parent's end open here a dropped player reads as EOF
+    parent.close()
+    try:
+        while True:
+            task = connection.recv()
+            if task is None:
+                return
+            finish = handler(task, stop, *arguments)
+            connection.send(finish(connection.recv()))
+    except EOFError:
+        # the player was dropped without close()
+        return
+
+
+class Ponderer:
+
+    # Runs handler(task, stop, *arguments) in a background process while the
+    # opponent thinks. The handler works until the shared stop flag is set and
+    # returns a finish(message) function, stop(message) hands it the move
+    # that was actually played and returns what it keeps.
+    def __init__(self, handler, *arguments):
+        self.handler = handler
+        self.arguments = arguments
+        self.stop_flag = multiprocessing.RawValue('b', 0)
+        self.process = None
+        self.connection = None
+        self.active = False
+
+    def start(self, task):
+        if self.process is None:
+            self.connection, child = multiprocessing.Pipe()
+            self.process = multiprocessing.Process(
+                target=serve, args=(child, self.connection, self.stop_flag, self.handler, self.arguments),
+                daemon=True)
+            self.process.start()
+            child.close()
+        self.stop_flag.value = 0
+        self.connection.send(task)
+        self.active = True
+
+    def stop(self, message=None):
+        if not self.active:
+            return None
+        self.stop_flag.value = 1
+        self.connection.send(message)
+        self.active = False
+        return self.connection.recv()
+
+    def close(self):
+        if self.process is not None:
+            self.stop()
+            self.connection.send(None)
+            self.process.join()
+            self.process = None
+            self.connection = None
+
+    def __getstate__(self):
+        result = self.__dict__.copy()
+        result['process'] = None
+        result['connection'] = None
+        result['active'] = False
+        return result
+
+
+def opponent_to_move(player, move):
+    # pondering only makes sense once our move is complete and the game goes on
+    state = player.game.state
+    if move is None or state.player == player.player_index:
+        return False
+    return len(state.get_viable_moves()) > 0 and not state.game_ended
+
+
+def ponder_tree(task, stop):
+    state, root, rollout_policy, tablebase, solver, rave, prior, value_model, batch_size, limit, seed = task
+    random.seed(seed)
+    tree = MonteCarloTreeSearch.Tree(rollout_policy, tablebase, solver, rave, prior)
+    tree.root = root
+    tree.set_state(state)
+    iterations = 0
+    while not stop.value and (limit is None or iterations < limit):
+        if value_model is not None:
+            iterations += tree.perform_batch(value_model.evaluate_positions, batch_size)
+        else:
+            tree.perform_iteration()
+            iterations += 1
+    def finish(move):
+        # only the subtree of the reply that was played goes back
+        hit = move is not None and tree.root.get_child(move) is not None
+        if move is not None:
+            tree.advance_root(move)
+        return {'root': tree.root if move is not None else None, 'iterations': iterations, 'hit': hit}
+    return finish
+
+
+def ponder_search(task, stop, table):
+    # searches our answers to the opponent's replies into the shared table,
+    # the reply the last search expected first
+    state, depth, evaluation, tablebase, seed = task
+    random.seed(seed)
+    ordering = Minimax.MoveOrdering()
+    entry = table.probe(state.hash)
+    expected = entry[4] if entry is not None else None
+    replies = state.get_viable_moves()
+    replies = sorted(replies, key=lambda reply: reply != expected)
+    searched, nodes = [], 0
+    for reply in replies:
+        if stop.value:
+            break
+        record = state.perform_action(reply)
+        if len(state.get_viable_moves()) > 0 and not state.game_ended:
+            for current in range(1, depth + 1):
+                decider = Minimax.Minimax(state, current, table, None, ordering, evaluation, tablebase,
+                                          stop)
+                try:
+                    decider.get_best_move()
+                except Minimax.SearchTimeout:
+                    nodes += decider.nodes
+                    break
+                nodes += decider.nodes
+            else:
+                searched.append(reply)
+        state.undo_action(record)
+    def finish(move):
+        return {'nodes': nodes, 'replies': len(searched), 'hit': move in searched}
+    return finish
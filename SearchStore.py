@@ -0,0 +1,125 @@
+import heapq
+import struct
+
+from copy import deepcopy
+
+import numpy as np
+
+from EntryTable import find_entries, read_entries, write_entries
+from OpeningBook import decode_move, encode_move
+
+TREE_MAGIC = b'CKTREE01'
+TABLE_MAGIC = b'CKTABL02'
+HEADER = struct.Struct('<8sII')
+# table values only mean something to searches with the same evaluation, so
+# its name follows the common header
+TABLE_HEADER = struct.Struct('<8sII16s')
+# one entry per (position, move) edge of a Monte Carlo tree, wins are counted
+# for the player to move in the position and proven is NOT_PROVEN or twice the
+# exact score of player 0
+TREE_ENTRY = np.dtype([('key', '<u8'), ('move', '<u2'), ('proven', 'i1'), ('visits', '<u4'),
+                       ('wins', '<f4')])
+# one entry per position of a transposition table, depth 0 marks a free slot
+TABLE_ENTRY = np.dtype([('key', '<u8'), ('value', '<f8'), ('depth', 'u1'), ('bound', 'u1'),
+                        ('move', '<u2')])
+NOT_PROVEN = -1
+NO_MOVE = 0xFFFF
+
+
+def collect_tree(tree, statistics=None):
+    # walks the whole tree with make/unmake to key every edge by position
+    statistics = {} if statistics is None else statistics
+    state = deepcopy(tree.state)
+    stack = [(tree.root, None)]
+    while stack:
+        node, move = stack.pop()
+        if node is None:
+            # move is the record of the move that led to a finished subtree
+            state.undo_action(move)
+            continue
+        if move is not None:
+            stack.append((None, state.perform_action(move)))
+        for move, child in zip(node.child_moves, node.children):
+            entry = statistics.setdefault((state.hash, encode_move(move)), [0, 0.0, None])
+            entry[0] += child.visits
+            entry[1] += child.wins
+            if child.proven is not None:
+                entry[2] = child.proven
+            if child.children:
+                stack.append((child, move))
+    return statistics
+
+
+def write_tree(path, statistics, nodes=1 << 16, load_factor=0.5):
+    # a child never has more visits than its parent, so the most visited
+    # edges form a tree hanging from the root; unvisited ones would read as
+    # free slots
+    visited = (item for item in statistics.items() if item[1][0] > 0)
+    best = heapq.nlargest(nodes, visited, key=lambda item: item[1][0])
+    rows = [(key, move, NOT_PROVEN if proven is None else int(2 * proven), min(visits, 0xFFFFFFFF), wins)
+            for (key, move), (visits, wins, proven) in best]
+    write_entries(path, HEADER, (TREE_MAGIC,), TREE_ENTRY, rows, load_factor)
+
+
+class TreeFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.table, self.size, _ = read_entries(path, HEADER, TREE_MAGIC, TREE_ENTRY, 'a search tree')
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def entries(self, key):
+        found = False
+        for entry_key, move, proven, visits, wins in find_entries(self.table, key, 'visits'):
+            found = True
+            yield decode_move(move), visits, wins, None if proven == NOT_PROVEN else proven / 2
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+def collect_table(table, statistics=None):
+    # keeps the deepest result for every position
+    statistics = {} if statistics is None else statistics
+    for key, depth, value, bound, move, generation in table.entries():
+        if key not in statistics or statistics[key][0] < depth:
+            statistics[key] = (depth, value, bound, move)
+    return statistics
+
+
+def write_table(path, statistics, evaluation, load_factor=0.5):
+    rows = [(key, value, depth, bound, NO_MOVE if move is None else encode_move(move))
+            for key, (depth, value, bound, move) in statistics.items()]
+    write_entries(path, TABLE_HEADER, (TABLE_MAGIC, evaluation.encode()), TABLE_ENTRY, rows, load_factor)
+
+
+class TableFile:
+
+    # read-only transposition table behind a live one, see
+    # Minimax.TranspositionTable.base; entries carry generation -1 so any
+    # store into the live table takes precedence, and evaluation names the
+    # Minimax.EVALUATIONS entry the values were searched with
+    def __init__(self, path):
+        self.path = path
+        self.table, self.size, (evaluation,) = read_entries(path, TABLE_HEADER, TABLE_MAGIC, TABLE_ENTRY,
+                                                          'a search table')
+        self.evaluation = evaluation.rstrip(b'\0').decode()
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def probe(self, key):
+        for entry_key, value, depth, bound, move in find_entries(self.table, key, 'depth'):
+            return key, depth, value, bound, None if move == NO_MOVE else decode_move(move), -1
+        return None
@@ -0,0 +1,282 @@
+import itertools
+import multiprocessing
+import os
+
+import numpy as np
+
+import Zobrist
+
+from Bitboard import square_targets
+
+SQUARES = Zobrist.SQUARES
+CHUNK_SIZE = 1 << 14
+# a byte per position, seen from the side to move: 0 is a draw,
+# 1..127 a win and 128..255 a loss in (code & 127) turns
+LOSS = 128
+MAX_DISTANCE = 127
+
+
+def build_jumps(neighbors, landings):
+    return [[(1 << middle, landing) for middle, landing in zip(middles, row) if landing is not None]
+            for middles, row in zip(neighbors, landings)]
+
+
+NEIGHBORS = [[target for target in row if target is not None] for row in square_targets(1)]
+JUMPS = build_jumps(square_targets(1), square_targets(2))
+
+
+def comb(n, k):
+    # math.comb needs Python 3.8
+    result = 1
+    for i in range(k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+def build_combinations(count):
+    # colexicographic order, so the rank of a set is sum(comb(square, k + 1))
+    combinations = sorted(itertools.combinations(range(SQUARES), count), key=lambda c: c[::-1])
+    masks = [sum(1 << square for square in combination) for combination in combinations]
+    return masks, {mask: rank for rank, mask in enumerate(masks)}
+
+
+COMBINATIONS = {}
+
+
+def get_combinations(count):
+    if count not in COMBINATIONS:
+        COMBINATIONS[count] = build_combinations(count)
+    return COMBINATIONS[count]
+
+
+def squares(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def table_size(mover, opponent):
+    return comb(SQUARES, mover) * comb(SQUARES, opponent)
+
+
+def table_path(directory, mover, opponent):
+    return os.path.join(directory, 'kings_%d_%d.bin' % (mover, opponent))
+
+
+def decode(code):
+    if code == 0:
+        return 0, 0
+    if code < LOSS:
+        return 1, code
+    return -1, code - LOSS
+
+
+def is_lone_kings_draw(own, opponent):
+    first = Zobrist.FIELDS[own.bit_length() - 1]
+    second = Zobrist.FIELDS[opponent.bit_length() - 1]
+    return abs(first[0] - second[0]) > 1 or abs(first[1] - second[1]) > 1
+
+
+class Tablebase:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {}
+        self.probes = 0
+        self.hits = 0
+
+    def __getstate__(self):
+        return self.directory
+
+    def __setstate__(self, directory):
+        self.__init__(directory)
+
+    def get_table(self, mover, opponent):
+        key = (mover, opponent)
+        if key not in self.tables:
+            path = table_path(self.directory, mover, opponent)
+            table = None
+            if os.path.exists(path):
+                table = np.memmap(path, dtype=np.uint8, mode='r', shape=(table_size(mover, opponent),))
+            self.tables[key] = table
+        return self.tables[key]
+
+    def lookup(self, own, opponent):
+        if own == 0:
+            return LOSS
+        mover, defender = bin(own).count('1'), bin(opponent).count('1')
+        table = self.get_table(mover, defender)
+        if table is None:
+            return None
+        index = get_combinations(mover)[1][own] * comb(SQUARES, defender) + get_combinations(defender)[1][opponent]
+        return int(table[index])
+
+    def probe(self, state):
+        figures = state.figures
+        if figures[0] or figures[1] or state.only_viable_field is not None:
+            return None
+        mover, defender = figures[2 + state.player], figures[3 - state.player]
+        if mover > 0 and self.get_table(mover, defender) is None:
+            return None
+        self.probes += 1
+        masks = state.get_masks()
+        code = self.lookup(masks[state.player], masks[1 - state.player])
+        if code is None:
+            return None
+        result, distance = decode(code)
+        # the tables ignore the pacifist draw, so only trust wins that come in time
+        if result != 0 and state.pacifist_turns + distance >= 50:
+            return None
+        self.hits += 1
+        if result == 0:
+            return None, distance
+        return (state.player if result > 0 else 1 - state.player), distance
+
+    def stats(self):
+        return {'probes': self.probes, 'hits': self.hits}
+
+
+def gather_captures(own, opponent, square, captures):
+    found = False
+    for middle, landing in JUMPS[square]:
+        if opponent & middle and not (own | opponent) & (1 << landing):
+            found = True
+            gather_captures(own ^ (1 << square) ^ (1 << landing), opponent ^ middle, landing, captures)
+    if not found:
+        captures.append((own, opponent))
+    return found
+
+
+def solve_captures(tablebase, own, opponent):
+    captures = []
+    for square in squares(own):
+        for middle, landing in JUMPS[square]:
+            if opponent & middle and not (own | opponent) & (1 << landing):
+                gather_captures(own ^ (1 << square) ^ (1 << landing), opponent ^ middle, landing, captures)
+    if not captures:
+        return None
+    best_result, best_distance = -2, 0
+    for after_own, after_opponent in captures:
+        result, distance = decode(tablebase.lookup(after_opponent, after_own))
+        result, distance = -result, distance + 1
+        if result > best_result:
+            best_result, best_distance = result, distance
+        elif result == best_result:
+            if result > 0:
+                best_distance = min(best_distance, distance)
+            elif result < 0:
+                best_distance = max(best_distance, distance)
+    return best_result, best_distance
+
+
+def enumerate_chunk(task):
+    # returns the positions decided without a quiet move and the quiet
+    # successors of the rest, indexed in the table with the sides swapped
+    directory, mover, opponent, start, stop = task
+    tablebase = Tablebase(directory)
+    own_masks = get_combinations(mover)[0]
+    opponent_masks = get_combinations(opponent)[0]
+    own_ranks = get_combinations(mover)[1]
+    opponent_ranks = get_combinations(opponent)[1]
+    stride, swapped_stride = comb(SQUARES, opponent), comb(SQUARES, mover)
+    results = np.zeros(stop - start, dtype=np.int8)
+    distances = np.zeros(stop - start, dtype=np.int16)
+    counts = np.zeros(stop - start, dtype=np.int32)
+    successors = []
+    for index in range(start, stop):
+        own = own_masks[index // stride]
+        other = opponent_masks[index % stride]
+        if own & other:
+            continue
+        solved = solve_captures(tablebase, own, other)
+        if solved is not None:
+            results[index - start], distances[index - start] = solved
+            continue
+        if mover == 1 and opponent == 1 and is_lone_kings_draw(own, other):
+            continue
+        occupied = own | other
+        count = 0
+        for square in squares(own):
+            for target in NEIGHBORS[square]:
+                if not occupied & (1 << target):
+                    successors.append(opponent_ranks[other] * swapped_stride
+                                      + own_ranks[own ^ (1 << square) ^ (1 << target)])
+                    count += 1
+        if count == 0:
+            results[index - start] = -1
+        counts[index - start] = count
+    return results, distances, counts, np.array(successors, dtype=np.int32)
+
+
+def enumerate_materials(directory, materials, pool):
+    tasks = []
+    for mover, opponent in materials:
+        size = table_size(mover, opponent)
+        for start in range(0, size, CHUNK_SIZE):
+            tasks.append((directory, mover, opponent, start, min(start + CHUNK_SIZE, size)))
+    chunks = pool.map(enumerate_chunk, tasks) if pool is not None else map(enumerate_chunk, tasks)
+    parts = {material: [] for material in materials}
+    for task, chunk in zip(tasks, chunks):
+        parts[task[1:3]].append(chunk)
+    return {material: [np.concatenate(arrays) for arrays in zip(*chunks)]
+            for material, chunks in parts.items()}
+
+
+def solve(positions):
+    # retrograde by rounds: a position is won in d turns when a successor is
+    # lost in d - 1, and lost in d when every successor is won in at most d - 1
+    classes = {}
+    for material, (results, distances, counts, successors) in positions.items():
+        quiet = np.nonzero(counts)[0]
+        segments = np.zeros(len(quiet), dtype=np.int64)
+        segments[1:] = np.cumsum(counts[quiet])[:-1]
+        classes[material] = (results, distances, quiet, segments, successors)
+    last = max([int(d.max()) for _, d, _, _, _ in classes.values() if len(d)] + [0])
+    distance = 1
+    while True:
+        changes = []
+        for (mover, opponent), (results, distances, quiet, segments, successors) in classes.items():
+            if len(quiet) == 0:
+                continue
+            after_results, after_distances = classes[(opponent, mover)][:2]
+            values, steps = after_results[successors], after_distances[successors]
+            lost_now = np.logical_or.reduceat((values == -1) & (steps == distance - 1), segments)
+            all_won = np.logical_and.reduceat(values == 1, segments)
+            slowest = np.maximum.reduceat(np.where(values == 1, steps, 0), segments)
+            open_ = results[quiet] == 0
+            wins = quiet[open_ & lost_now]
+            losses = quiet[open_ & ~lost_now & all_won & (slowest == distance - 1)]
+            changes.append((results, distances, wins, losses))
+        changed = False
+        for results, distances, wins, losses in changes:
+            results[wins], distances[wins] = 1, distance
+            results[losses], distances[losses] = -1, distance
+            changed = changed or len(wins) > 0 or len(losses) > 0
+        if not changed and distance > last + 1:
+            break
+        distance += 1
+    return {material: (results, distances) for material, (results, distances, _, _, _) in classes.items()}
+
+
+def write_table(directory, mover, opponent, results, distances):
+    if distances.max(initial=0) > MAX_DISTANCE:
+        raise ValueError("Distance %d does not fit the table" % distances.max())
+    codes = np.where(results > 0, distances, np.where(results < 0, LOSS + distances, 0)).astype(np.uint8)
+    codes.tofile(table_path(directory, mover, opponent))
+
+
+def generate(directory, pieces=4, workers=None):
+    os.makedirs(directory, exist_ok=True)
+    pool = multiprocessing.Pool(workers) if workers != 1 else None
+    try:
+        for total in range(2, pieces + 1):
+            # captures only lead to smaller totals, which are already on disk
+            materials = [(mover, total - mover) for mover in range(1, total)]
+            solved = solve(enumerate_materials(directory, materials, pool))
+            for (mover, opponent), (results, distances) in solved.items():
+                write_table(directory, mover, opponent, results, distances)
+                yield mover, opponent, results
+    finally:
+        if pool is not None:
+            pool.terminate()
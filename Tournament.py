@@ -0,0 +1,221 @@
+import math
+import multiprocessing
+import random
+import time
+
+import Checkers
+import GameRecords
+import Instrumentation
+import OpeningBook
+import SearchStore
+import Tablebase
+import ValueModel
+
+from Bitboard import BitboardGameState
+from MoveCache import MoveCache
+from single_game import get_player
+
+ENGINES = {
+    'list': Checkers.GameState,
+    'bitboard': BitboardGameState,
+}
+# every process keeps one move cache across its games, since self-play keeps
+# returning to the same openings and endgames
+MOVE_CACHES = {}
+
+
+def get_move_cache(engine, capacity):
+    key = (engine, capacity)
+    if key not in MOVE_CACHES:
+        MOVE_CACHES[key] = MoveCache(capacity)
+    return MOVE_CACHES[key]
+
+
+def cache_counters(cache):
+    return [cache.hits, cache.misses, cache.evictions]
+
+
+def play_game(task):
+    (index, player_types, seed, engine, move_cache, book, tablebase, record, value_model, stored_tree,
+     stored_table) = task
+    random.seed(seed)
+    cache = get_move_cache(engine, move_cache) if move_cache else None
+    counters = cache_counters(cache) if cache is not None else None
+    game = Checkers.Game(ENGINES[engine](cache))
+    players = [get_player(player_type) for player_type in player_types]
+    if book is not None:
+        book = OpeningBook.OpeningBook(book)
+        for player in players:
+            if hasattr(player, 'book'):
+                player.book = book
+    if tablebase is not None:
+        tablebase = Tablebase.Tablebase(tablebase)
+        for player in players:
+            if hasattr(player, 'tablebase'):
+                player.tablebase = tablebase
+    if stored_tree is not None:
+        stored_tree = SearchStore.TreeFile(stored_tree)
+        for player in players:
+            if hasattr(player, 'stored_tree'):
+                player.stored_tree = stored_tree
+    if stored_table is not None:
+        stored_table = SearchStore.TableFile(stored_table)
+        for player in players:
+            if hasattr(player, 'stored_table'):
+                player.stored_table = stored_table
+    if value_model is not None:
+        value_model = ValueModel.ValueModel.load(value_model)
+        for player in players:
+            if hasattr(player, 'value_model') and getattr(player, 'parallel', None) is None:
+                player.value_model = value_model
+    runner = Checkers.GameRunner(game, players[0], players[1])
+    recorder = GameRecords.GameRecorder(game) if record else None
+    if Instrumentation.ENABLED:
+        Instrumentation.start_sampler()
+    start = time.perf_counter()
+    winner = runner.run()
+    result = {
+        'game': index,
+        'players': player_types,
+        'seed': seed,
+        'winner': winner,
+        'time': time.perf_counter() - start,
+        'moves': game.history,
+    }
+    if cache is not None:
+        # the cache outlives the game, so only this game's share is reported
+        result['move_cache'] = [now - before for now, before in zip(cache_counters(cache), counters)]
+        if Instrumentation.ENABLED:
+            for key, delta in zip(('hits', 'misses', 'evictions'), result['move_cache']):
+                Instrumentation.count('move_cache.' + key, delta)
+    if recorder is not None:
+        result['records'] = recorder.records
+    if Instrumentation.ENABLED:
+        result['profile'] = Instrumentation.PROFILE.drain()
+    return result
+
+
+def elo_difference(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_estimate(wins, draws, losses, z=1.96):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = z * math.sqrt(variance / games)
+    return elo_difference(score), elo_difference(score - margin), elo_difference(score + margin)
+
+
+class Standings:
+
+    def __init__(self):
+        self.pairings = {}
+        self.players = {}
+
+    def record(self, result):
+        first, second = result['players']
+        if result['winner'] is None:
+            outcomes = (1, 1)
+        else:
+            outcomes = (2, 0) if result['winner'] == 0 else (0, 2)
+        key = tuple(sorted((first, second)))
+        pairing = self.pairings.setdefault(key, [0, 0, 0])
+        outcome = outcomes[0] if first == key[0] else outcomes[1]
+        pairing[2 - outcome] += 1
+        for player_type, outcome in zip((first, second), outcomes):
+            totals = self.players.setdefault(player_type, [0, 0, 0])
+            totals[2 - outcome] += 1
+
+    def table(self):
+        lines = ["%-28s %5s %5s %5s %8s  %s" % ('pairing', 'W', 'D', 'L', 'Elo', '95% CI')]
+        for (first, second), (wins, draws, losses) in sorted(self.pairings.items()):
+            elo, low, high = elo_estimate(wins, draws, losses)
+            lines.append("%-28s %5d %5d %5d %+8.0f  [%+.0f, %+.0f]" % (
+                first + ' vs ' + second, wins, draws, losses, elo, low, high))
+        lines.append('')
+        lines.append("%-28s %5s %5s %5s" % ('player', 'W', 'D', 'L'))
+        for player_type, (wins, draws, losses) in sorted(self.players.items()):
+            lines.append("%-28s %5d %5d %5d" % (player_type, wins, draws, losses))
+        return '\n'.join(lines)
+
+
+class Tournament:
+
+    def __init__(self, pairings, games, seed=0, swap_colours=True, engine='bitboard', workers=None,
+                 move_cache=None, book=None, tablebase=None, record=None, compress_records=False,
+                 value_model=None, stored_tree=None, stored_table=None):
+        self.pairings = pairings
+        self.games = games
+        self.seed = seed
+        self.swap_colours = swap_colours
+        self.engine = engine
+        self.workers = workers or multiprocessing.cpu_count()
+        self.move_cache = move_cache
+        self.book = book
+        self.tablebase = tablebase
+        self.record = record
+        self.compress_records = compress_records
+        self.value_model = value_model
+        self.stored_tree = stored_tree
+        self.stored_table = stored_table
+        self.cache_counters = [0, 0, 0]
+        self.standings = Standings()
+
+    def schedule(self):
+        rng = random.Random(self.seed)
+        tasks = []
+        for first, second in self.pairings:
+            for i in range(self.games):
+                player_types = (first, second)
+                if self.swap_colours and i % 2 == 1:
+                    player_types = (second, first)
+                tasks.append((len(tasks), player_types, rng.getrandbits(32), self.engine,
+                              self.move_cache, self.book, self.tablebase,
+                              self.record is not None, self.value_model, self.stored_tree,
+                              self.stored_table))
+        return tasks
+
+    def run(self):
+        tasks = self.schedule()
+        writer = None
+        if self.record is not None:
+            writer = GameRecords.RecordWriter(self.record, self.compress_records)
+        try:
+            if self.workers == 1:
+                for task in tasks:
+                    yield self.finish(play_game(task), writer)
+                return
+            pool = multiprocessing.Pool(self.workers)
+            try:
+                for result in pool.imap_unordered(play_game, tasks):
+                    yield self.finish(result, writer)
+            finally:
+                pool.terminate()
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def finish(self, result, writer=None):
+        records = result.pop('records', None)
+        profile = result.pop('profile', None)
+        counters = result.pop('move_cache', None)
+        if counters is not None:
+            self.cache_counters = [total + delta for total, delta in zip(self.cache_counters, counters)]
+        if profile is not None:
+            Instrumentation.PROFILE.merge(profile)
+        if writer is not None and records is not None:
+            writer.write(records)
+        self.standings.record(result)
+        return result
+
+    def move_cache_stats(self):
+        # summed over every process and game so far
+        hits, misses, evictions = self.cache_counters
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.0,
+            'evictions': evictions,
+        }
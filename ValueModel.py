@@ -0,0 +1,128 @@
+import numpy as np
+
+import GameRecords
+
+SQUARES = 32
+PLANES = 4
+FEATURES = PLANES * SQUARES + 1
+
+
+def features(pieces, kings, players):
+    # pawn and king planes for both sides plus the side to move
+    pieces = np.asarray(pieces, dtype='<u4').reshape(-1, 2)
+    kings = np.asarray(kings, dtype='<u4').reshape(-1)
+    planes = np.stack([pieces[:, 0] & ~kings, pieces[:, 1] & ~kings,
+                       pieces[:, 0] & kings, pieces[:, 1] & kings], axis=1)
+    bits = np.unpackbits(np.ascontiguousarray(planes).view(np.uint8), axis=1, bitorder='little')
+    result = np.empty((len(planes), FEATURES), dtype=np.float32)
+    result[:, :-1] = bits
+    result[:, -1] = players
+    return result
+
+
+def flip(x):
+    # the board turned around with colours swapped, square s becomes 31 - s
+    planes = x[:, :-1].reshape(-1, PLANES, SQUARES)[:, [1, 0, 3, 2], ::-1]
+    result = np.empty_like(x)
+    result[:, :-1] = planes.reshape(-1, PLANES * SQUARES)
+    result[:, -1] = 1 - x[:, -1]
+    return result
+
+
+def record_features(records):
+    return features(records['pieces'], records['kings'], records['player'])
+
+
+def record_targets(records):
+    # expected score of player 0
+    result = records['result']
+    return np.where(result == GameRecords.DRAW, 0.5, 1.0 - result).astype(np.float32)
+
+
+def sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+
+class ValueModel:
+
+    def __init__(self, hidden=0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.hidden = hidden
+        self.parameters = {}
+        inputs = FEATURES
+        if hidden:
+            self.parameters['W1'] = rng.normal(0, inputs ** -0.5, (inputs, hidden)).astype(np.float32)
+            self.parameters['b1'] = np.zeros(hidden, dtype=np.float32)
+            inputs = hidden
+        self.parameters['W2'] = rng.normal(0, inputs ** -0.5, inputs).astype(np.float32) * 0.1
+        self.parameters['b2'] = np.zeros(1, dtype=np.float32)
+        self.velocity = {name: np.zeros_like(value) for name, value in self.parameters.items()}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            model = cls(int(data['hidden']))
+            for name in model.parameters:
+                model.parameters[name] = data[name]
+        return model
+
+    def save(self, path):
+        np.savez(path, hidden=self.hidden, **self.parameters)
+
+    def forward(self, x):
+        p = self.parameters
+        hidden = np.tanh(x @ p['W1'] + p['b1']) if self.hidden else x
+        return hidden @ p['W2'] + p['b2'][0], hidden
+
+    def predict(self, x):
+        return sigmoid(self.forward(x)[0])
+
+    def evaluate_positions(self, masks, players):
+        masks = np.asarray(masks, dtype='<u4').reshape(-1, 3)
+        return self.predict(features(masks[:, :2], masks[:, 2], players))
+
+    def loss(self, x, y):
+        p = np.clip(self.predict(x), 1e-7, 1 - 1e-7)
+        return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+    def train_batch(self, x, y, learning_rate=0.05, l2=1e-5, momentum=0.9):
+        p = self.parameters
+        z, hidden = self.forward(x)
+        error = (sigmoid(z) - y) / len(x)
+        gradients = {'W2': hidden.T @ error + l2 * p['W2'], 'b2': np.array([error.sum()], dtype=np.float32)}
+        if self.hidden:
+            back = np.outer(error, p['W2']) * (1 - hidden * hidden)
+            gradients['W1'] = x.T @ back + l2 * p['W1']
+            gradients['b1'] = back.sum(axis=0)
+        for name, gradient in gradients.items():
+            self.velocity[name] = momentum * self.velocity[name] - learning_rate * gradient
+            p[name] += self.velocity[name].astype(np.float32)
+
+    def train(self, chunks, batch_size=256, learning_rate=0.05, l2=1e-5, augment=True, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        total, seen = 0.0, 0
+        for x, y in chunks:
+            if augment:
+                x, y = np.concatenate([x, flip(x)]), np.concatenate([y, 1 - y])
+            order = rng.permutation(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start:start + batch_size]
+                self.train_batch(x[batch], y[batch], learning_rate, l2)
+            total += self.loss(x, y) * len(x)
+            seen += len(x)
+        return total / seen if seen else 0.0
+
+
+class ModelEvaluation:
+
+    # Minimax callable: a scaled expected score for player 0, with a batched
+    # entry point for all children of a horizon node
+    def __init__(self, model, scale=100):
+        self.model = model
+        self.scale = scale
+
+    def __call__(self, state):
+        return self.evaluate_batch([state.get_masks()], [state.player])[0]
+
+    def evaluate_batch(self, masks, players):
+        return self.scale * (2 * self.model.evaluate_positions(masks, players) - 1)
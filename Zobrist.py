@@ -0,0 +1,27 @@
+import random
+
+SQUARES = 32
+FIELDS = [(s // 4, 2 * (s % 4) + (s // 4) % 2) for s in range(SQUARES)]
+
+_random = random.Random(0x636865636b657273)
+PIECES = [[_random.getrandbits(64) for square in range(SQUARES)] for figure in range(4)]
+PLAYER = _random.getrandbits(64)
+ONLY_VIABLE_FIELD = [_random.getrandbits(64) for square in range(SQUARES)]
+
+
+def square(field):
+    return field[0] * 4 + field[1] // 2
+
+
+def compute_hash(state):
+    result = 0
+    for i in range(state.board_size):
+        for j in range(i % 2, state.board_size, 2):
+            figure = state.get_field((i, j))
+            if figure >= 0:
+                result ^= PIECES[figure][square((i, j))]
+    if state.player == 1:
+        result ^= PLAYER
+    if state.only_viable_field is not None:
+        result ^= ONLY_VIABLE_FIELD[square(state.only_viable_field)]
+    return result
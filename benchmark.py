@@ -0,0 +1,333 @@
+#!/usr/bin/python3.6
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import Checkers
+import Minimax
+import MonteCarloTreeSearch
+import ParallelMinimax
+import Players
+import Zobrist
+
+from single_game import PLAYER_TYPES, get_player
+from Tournament import ENGINES
+
+POSITION_SETS = ('opening', 'middlegame', 'multi_jump', 'kings_endgame', 'late_endgame')
+RATE_SUFFIX = '_per_second'
+RATIO_SUFFIXES = ('.speedup', '.search_overhead', '.score')
+MCTS_VARIANTS = {
+    'solver': {'solver': True},
+    'rave': {'rave': 50},
+    'rave_300': {'rave': 300},
+    'solver_rave': {'solver': True, 'rave': 50},
+}
+
+
+def play_randomly(state, plies, rng):
+    for ply in range(plies):
+        moves = state.get_viable_moves()
+        if len(moves) == 0 or state.game_ended:
+            return False
+        state.perform_action(rng.choice(moves))
+    return not state.game_ended and len(state.get_viable_moves()) > 0
+
+
+def opening_position(rng):
+    state = Checkers.GameState()
+    return state if play_randomly(state, rng.randint(2, 8), rng) else None
+
+
+def middlegame_position(rng):
+    state = Checkers.GameState()
+    if not play_randomly(state, rng.randint(16, 30), rng):
+        return None
+    return state if 10 <= sum(state.figures) <= 18 else None
+
+
+def multi_jump_position(rng):
+    state = Checkers.GameState()
+    for ply in range(120):
+        moves = state.get_viable_moves()
+        if len(moves) == 0 or state.game_ended:
+            return None
+        for move in moves:
+            record = state.perform_action(move)
+            continues = state.only_viable_field is not None
+            state.undo_action(record)
+            if continues:
+                return state
+        state.perform_action(rng.choice(moves))
+    return None
+
+
+def kings_endgame_position(rng):
+    state = Checkers.GameState()
+    for field in Zobrist.FIELDS:
+        if state.get_field(field) >= 0:
+            state.remove_figure(field)
+    fields = rng.sample(Zobrist.FIELDS, rng.randint(4, 6))
+    for index, field in enumerate(fields):
+        state.add_figure(2 + index % 2, field)
+    state.player = rng.randint(0, 1)
+    state.hash = Zobrist.compute_hash(state)
+    return state if not state.game_ended and len(state.get_viable_moves()) > 0 else None
+
+
+def late_endgame_position(rng):
+    # random play down to a handful of pieces, often close enough to the end to be proven
+    state = Checkers.GameState()
+    while bin(state.get_masks()[0] | state.get_masks()[1]).count('1') > 6:
+        moves = state.get_viable_moves()
+        if len(moves) == 0 or state.game_ended:
+            return None
+        state.perform_action(rng.choice(moves))
+    return state if not state.game_ended and len(state.get_viable_moves()) > 0 else None
+
+
+POSITION_BUILDERS = {
+    'opening': opening_position,
+    'middlegame': middlegame_position,
+    'multi_jump': multi_jump_position,
+    'kings_endgame': kings_endgame_position,
+    'late_endgame': late_endgame_position,
+}
+
+
+def build_positions(count, seed=0):
+    rng = random.Random(seed)
+    positions = {}
+    for name in POSITION_SETS:
+        positions[name] = []
+        while len(positions[name]) < count:
+            state = POSITION_BUILDERS[name](rng)
+            if state is not None:
+                positions[name].append(state)
+    return positions
+
+
+def perft(state, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in state.get_viable_moves():
+        record = state.perform_action(move)
+        nodes += perft(state, depth - 1)
+        state.undo_action(record)
+    return nodes
+
+
+def rate(count, elapsed):
+    return count / elapsed if elapsed > 0 else 0.0
+
+
+def benchmark_perft(states, depth):
+    start, nodes = time.perf_counter(), 0
+    for state in states:
+        nodes += perft(state, depth)
+    return {'nodes': nodes, 'nodes' + RATE_SUFFIX: rate(nodes, time.perf_counter() - start)}
+
+
+def benchmark_minimax(states, depth, seed):
+    random.seed(seed)
+    start, nodes = time.perf_counter(), 0
+    for state in states:
+        decider = Minimax.Minimax(state, depth, Minimax.TranspositionTable())
+        decider.get_best_move()
+        nodes += decider.nodes
+    return {'nodes': nodes, 'nodes' + RATE_SUFFIX: rate(nodes, time.perf_counter() - start)}
+
+
+def benchmark_lazy_smp(states, depth, workers, seed):
+    # time to depth against a single worker, pools are started before the clock
+    timings = {}
+    for count in sorted({1, workers}):
+        search = ParallelMinimax.LazySMPSearch(count)
+        search.get_pool()
+        random.seed(seed)
+        start, nodes = time.perf_counter(), 0
+        for state in states:
+            nodes += search.search(state, depth, None, Minimax.heuristic_evaluation)[2]
+        timings[count] = (time.perf_counter() - start, nodes)
+        search.close()
+    (serial_time, serial_nodes), (elapsed, nodes) = timings[1], timings[workers]
+    return {
+        'nodes': serial_nodes,
+        'nodes' + RATE_SUFFIX: rate(nodes, elapsed),
+        'speedup': serial_time / elapsed if elapsed > 0 else 0.0,
+        'search_overhead': nodes / serial_nodes - 1 if serial_nodes else 0.0,
+    }
+
+
+def benchmark_mcts(states, iterations, seed):
+    random.seed(seed)
+    start, steps = time.perf_counter(), 0
+    for state in states:
+        tree = MonteCarloTreeSearch.Tree()
+        tree.set_state(state)
+        for i in range(iterations):
+            steps += tree.perform_iteration()
+    elapsed = time.perf_counter() - start
+    total = iterations * len(states)
+    return {'iterations' + RATE_SUFFIX: rate(total, elapsed), 'rollout_steps' + RATE_SUFFIX: rate(steps, elapsed)}
+
+
+def benchmark_mcts_variant(variant, states, iterations, games, engine, seed):
+    # speed on the middlegame set, proofs found on the late endgame set and
+    # the score against plain UCT given the same number of iterations
+    options = MCTS_VARIANTS[variant]
+    random.seed(seed)
+    start = time.perf_counter()
+    for state in states['middlegame']:
+        tree = MonteCarloTreeSearch.Tree(**options)
+        tree.set_state(state)
+        for i in range(iterations):
+            tree.perform_iteration()
+    elapsed = time.perf_counter() - start
+    solved = 0
+    for state in states['late_endgame']:
+        tree = MonteCarloTreeSearch.Tree(**options)
+        tree.set_state(state)
+        for i in range(iterations):
+            tree.perform_iteration()
+            if tree.root.proven is not None:
+                solved += 1
+                break
+    score = 0.0
+    for i in range(games):
+        players = [Players.MonteCarloPlayer(iterations, **options), Players.MonteCarloPlayer(iterations)]
+        colour = i % 2
+        if colour:
+            players.reverse()
+        game = Checkers.Game(ENGINES[engine]())
+        winner = Checkers.GameRunner(game, players[0], players[1]).run()
+        score += 0.5 if winner is None else float(winner == colour)
+    return {
+        'iterations' + RATE_SUFFIX: rate(iterations * len(states['middlegame']), elapsed),
+        'solved': solved,
+        'score': score / games if games else 0.0,
+    }
+
+
+def benchmark_rollouts(states, rollouts, seed):
+    rng = random.Random(seed)
+    start, steps = time.perf_counter(), 0
+    for state in states:
+        for i in range(rollouts):
+            steps += MonteCarloTreeSearch.rollout(state, rng=rng)[1]
+    elapsed = time.perf_counter() - start
+    total = rollouts * len(states)
+    return {'rollouts' + RATE_SUFFIX: rate(total, elapsed), 'rollout_steps' + RATE_SUFFIX: rate(steps, elapsed)}
+
+
+def benchmark_games(player_type, engine, games, seed):
+    random.seed(seed)
+    start, plies = time.perf_counter(), 0
+    for i in range(games):
+        game = Checkers.Game(ENGINES[engine]())
+        Checkers.GameRunner(game, get_player(player_type), get_player(player_type)).run()
+        plies += len(game.history)
+    elapsed = time.perf_counter() - start
+    return {'games' + RATE_SUFFIX: rate(games, elapsed), 'plies' + RATE_SUFFIX: rate(plies, elapsed)}
+
+
+def run(engines, player_types, positions, perft_depth, minimax_depth, iterations, rollouts, games, seed,
+        smp_workers=None, mcts_variants=()):
+    results = {}
+    def record(prefix, values):
+        for name, value in values.items():
+            results[prefix + '.' + name] = value
+    for engine in engines:
+        states = {name: [ENGINES[engine].from_state(state) for state in group] for name, group in positions.items()}
+        for name in POSITION_SETS:
+            record('perft.%s.%s' % (name, engine), benchmark_perft(states[name], perft_depth))
+        for name in ('opening', 'middlegame'):
+            record('minimax.%s.depth%d.%s' % (name, minimax_depth, engine),
+                   benchmark_minimax(states[name], minimax_depth, seed))
+        if smp_workers:
+            record('lazy_smp.middlegame.depth%d.workers%d.%s' % (minimax_depth, smp_workers, engine),
+                   benchmark_lazy_smp(states['middlegame'], minimax_depth, smp_workers, seed))
+        record('mcts.middlegame.%s' % engine, benchmark_mcts(states['middlegame'], iterations, seed))
+        for variant in mcts_variants:
+            record('mcts_variants.%s.%s' % (variant, engine),
+                   benchmark_mcts_variant(variant, states, iterations, games, engine, seed))
+        record('rollouts.middlegame.%s' % engine, benchmark_rollouts(states['middlegame'], rollouts, seed))
+        for player_type in player_types:
+            record('games.%s.%s' % (player_type, engine), benchmark_games(player_type, engine, games, seed))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # rates may drift within the tolerance, counts must match exactly
+    lines, regressions = [], 0
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        value, previous = results[name], baseline[name]
+        if name.endswith(RATIO_SUFFIXES):
+            # parallel figures depend on the machine's load, they are only reported
+            lines.append("%-55s %12.2f %12.2f" % (name, previous, value))
+            continue
+        if name.endswith(RATE_SUFFIX):
+            ratio = value / previous if previous > 0 else float('inf')
+            regressed = ratio < 1 - tolerance
+            lines.append("%-55s %12.1f %12.1f %7.2fx%s" % (
+                name, previous, value, ratio, '  REGRESSION' if regressed else ''))
+        else:
+            regressed = value != previous
+            lines.append("%-55s %12d %12d %8s%s" % (
+                name, previous, value, '', '  CHANGED' if regressed else ''))
+        regressions += regressed
+    return lines, regressions
+
+
+parser = argparse.ArgumentParser(description="Benchmark move generation, search and full games.")
+parser.add_argument('--engine', choices=sorted(ENGINES) + ['all'], default='all')
+parser.add_argument('--players', nargs='*', default=[t for t in sorted(PLAYER_TYPES) if t != 'manual'])
+parser.add_argument('--positions', type=int, default=8, help="positions per set")
+parser.add_argument('--perft-depth', type=int, default=4)
+parser.add_argument('--minimax-depth', type=int, default=4)
+parser.add_argument('--iterations', type=int, default=200, help="MCTS iterations per position")
+parser.add_argument('--rollouts', type=int, default=50, help="rollouts per position")
+parser.add_argument('--games', type=int, default=2, help="self-play games per player type")
+parser.add_argument('--smp-workers', type=int, default=None,
+                    help="also time Lazy SMP minimax with this many workers against one")
+parser.add_argument('--mcts-variants', nargs='*', choices=sorted(MCTS_VARIANTS), default=[],
+                    help="also measure MCTS-Solver and RAVE against plain UCT, --games games each")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--output', default=None, help="write results here instead of standard output")
+parser.add_argument('--baseline', default=None, help="results of an earlier run to compare against")
+parser.add_argument('--tolerance', type=float, default=0.1, help="allowed relative slowdown")
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    engines = sorted(ENGINES) if args.engine == 'all' else [args.engine]
+    positions = build_positions(args.positions, args.seed)
+    results = run(engines, args.players, positions, args.perft_depth, args.minimax_depth,
+                  args.iterations, args.rollouts, args.games, args.seed, args.smp_workers,
+                  args.mcts_variants)
+    report = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differences = sorted(key for key, value in report['config'].items()
+                             if key != 'tolerance' and baseline['config'].get(key) != value)
+        if differences:
+            print("baseline settings differ: %s" % ', '.join(differences), file=sys.stderr)
+        lines, regressions = compare(results, baseline['results'], args.tolerance)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressions:
+            print("%d regressions against %s" % (regressions, args.baseline), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,28 @@
+#!/usr/bin/python3.6
+
+import argparse
+import itertools
+
+import OpeningBook
+import Tournament
+
+parser = argparse.ArgumentParser(description="Build an opening book from self-play games.")
+parser.add_argument('path', help="output file")
+parser.add_argument('players', nargs='*', default=['minimax', 'monte_carlo'],
+                    help="player types from single_game.get_player; every pairing, including "
+                         "each player against itself, is played")
+parser.add_argument('--games', type=int, default=50, help="games per pairing")
+parser.add_argument('--plies', type=int, default=16, help="moves recorded from the start of each game")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--workers', type=int, default=None)
+parser.add_argument('--engine', choices=sorted(Tournament.ENGINES), default='bitboard')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    tournament = Tournament.Tournament(
+        list(itertools.combinations_with_replacement(args.players, 2)), args.games,
+        seed=args.seed, engine=args.engine, workers=args.workers)
+    statistics = OpeningBook.collect(tournament.run(), args.plies)
+    OpeningBook.write(args.path, statistics)
+    print("%d positions and moves from %d games written to %s" % (
+        len(statistics), len(tournament.schedule()), args.path))
@@ -0,0 +1,77 @@
+#!/usr/bin/python3.6
+
+import argparse
+import multiprocessing
+import random
+
+import Minimax
+import MonteCarloTreeSearch
+import SearchStore
+import Tournament
+
+parser = argparse.ArgumentParser(
+    description="Search self-play openings and store the Monte Carlo statistics and minimax "
+                "transposition table for warm starts.")
+parser.add_argument('tree', help="output file for Monte Carlo statistics")
+parser.add_argument('table', help="output file for the transposition table")
+parser.add_argument('--games', type=int, default=32, help="opening lines searched")
+parser.add_argument('--plies', type=int, default=12, help="positions searched from the start of each line")
+parser.add_argument('--iterations', type=int, default=2000, help="Monte Carlo iterations per position")
+parser.add_argument('--depth', type=int, default=6, help="minimax depth per position, 0 skips the table")
+parser.add_argument('--evaluation', choices=sorted(Minimax.EVALUATIONS), default='material')
+parser.add_argument('--nodes', type=int, default=1 << 16, help="most visited tree edges kept")
+parser.add_argument('--table-size', type=int, default=1 << 18)
+parser.add_argument('--explore', type=float, default=0.25,
+                    help="chance of playing a random move instead of the best one")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--workers', type=int, default=None)
+parser.add_argument('--engine', choices=sorted(Tournament.ENGINES), default='bitboard')
+
+
+def search_line(task):
+    seed, engine, plies, iterations, depth, evaluation, table_size, explore = task
+    random.seed(seed)
+    state = Tournament.ENGINES[engine]()
+    table = Minimax.TranspositionTable(table_size)
+    ordering = Minimax.MoveOrdering()
+    trees = {}
+    for ply in range(plies):
+        moves = state.get_viable_moves()
+        if len(moves) == 0 or state.game_ended:
+            break
+        # a fresh tree per position, so reused subtrees are not counted twice
+        tree = MonteCarloTreeSearch.Tree()
+        tree.set_state(state)
+        for i in range(iterations):
+            tree.perform_iteration()
+        SearchStore.collect_tree(tree, trees)
+        if depth > 0:
+            ordering.new_search()
+            Minimax.Minimax(state, depth, table, ordering=ordering,
+                            evaluation=Minimax.EVALUATIONS[evaluation]).get_best_move()
+        move = random.choice(moves) if random.random() < explore else tree.get_best_move()
+        state.perform_action(move)
+    return trees, SearchStore.collect_table(table)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    tasks = [(rng.getrandbits(32), args.engine, args.plies, args.iterations, args.depth, args.evaluation,
+              args.table_size, args.explore) for i in range(args.games)]
+    trees, tables = {}, {}
+    with multiprocessing.Pool(args.workers) as pool:
+        for line_trees, line_table in pool.imap_unordered(search_line, tasks):
+            for edge, (visits, wins, proven) in line_trees.items():
+                entry = trees.setdefault(edge, [0, 0.0, None])
+                entry[0] += visits
+                entry[1] += wins
+                if proven is not None:
+                    entry[2] = proven
+            for key, entry in line_table.items():
+                if key not in tables or tables[key][0] < entry[0]:
+                    tables[key] = entry
+    SearchStore.write_tree(args.tree, trees, args.nodes)
+    SearchStore.write_table(args.table, tables, args.evaluation)
+    print("%d of %d tree edges written to %s, %d positions written to %s" % (
+        min(args.nodes, len(trees)), len(trees), args.tree, len(tables), args.table))
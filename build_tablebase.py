@@ -0,0 +1,18 @@
+#!/usr/bin/python3.6
+
+import argparse
+
+import numpy as np
+
+import Tablebase
+
+parser = argparse.ArgumentParser(description="Solve kings-only endgames into a tablebase directory.")
+parser.add_argument('directory')
+parser.add_argument('--pieces', type=int, default=4, help="largest total number of kings")
+parser.add_argument('--workers', type=int, default=None)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for mover, opponent, results in Tablebase.generate(args.directory, args.pieces, args.workers):
+        print("%d v %d: %d wins, %d losses, %d draws" % (
+            mover, opponent, np.sum(results > 0), np.sum(results < 0), np.sum(results == 0)))
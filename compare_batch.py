@@ -0,0 +1,80 @@
+#!/usr/bin/python3.6
+
+import argparse
+import random
+import sys
+
+import numpy as np
+
+import BatchCheckers
+
+from Tournament import ENGINES
+
+parser = argparse.ArgumentParser(
+    description="Play random games in lockstep on BatchGameState and GameState and report any difference.")
+parser.add_argument('--games', type=int, default=300, help="games per round")
+parser.add_argument('--rounds', type=int, default=2, help="rounds played on the same boards, reset in between")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--engine', choices=sorted(ENGINES), default='list')
+
+
+def differences(batch, moves, index, state):
+    found = []
+    if batch.game_ended[index] != state.game_ended or batch.game_drawn[index] != state.game_drawn:
+        found.append("flags %s/%s != %s/%s" % (batch.game_ended[index], batch.game_drawn[index],
+                                              state.game_ended, state.game_drawn))
+    if batch.player[index] != state.player:
+        found.append("player %d != %d" % (batch.player[index], state.player))
+    if batch.pacifist_turns[index] != state.pacifist_turns:
+        found.append("pacifist turns %d != %d" % (batch.pacifist_turns[index], state.pacifist_turns))
+    board = [state.get_field(field) for field in BatchCheckers.SQUARE_FIELDS]
+    if list(batch.boards[index, :BatchCheckers.SQUARES]) != board:
+        found.append("boards differ")
+    if not state.game_ended and sorted(batch.get_moves(moves, index)) != sorted(state.get_viable_moves()):
+        found.append("moves differ")
+    return found
+
+
+def play_round(batch, states, rng):
+    states = list(states)
+    plies, failures = 0, 0
+    while True:
+        moves = batch.get_viable_moves()
+        actions = np.full(batch.count, -1, dtype=np.intp)
+        for index, state in enumerate(states):
+            if state is None:
+                continue
+            viable = state.get_viable_moves()
+            found = differences(batch, moves, index, state)
+            if found:
+                failures += 1
+                print("game %d ply %d: %s" % (index, plies, ', '.join(found)))
+            if found or state.game_ended or len(viable) == 0:
+                states[index] = None
+                continue
+            move = rng.choice(viable)
+            actions[index] = batch.get_action(move)
+            state.perform_action(move)
+        if (actions < 0).all():
+            return plies, failures
+        batch.perform_actions(actions)
+        plies += int((actions >= 0).sum())
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    batch = BatchCheckers.BatchGameState(args.games)
+    states = [ENGINES[args.engine]() for i in range(args.games)]
+    total_plies, total_failures = 0, 0
+    for round_index in range(args.rounds):
+        # both sides are reused, so every engine's reset is compared too
+        if round_index > 0:
+            batch.reset()
+            for state in states:
+                state.reset()
+        plies, failures = play_round(batch, states, rng)
+        total_plies += plies
+        total_failures += failures
+    print("%d games, %d plies, %d mismatches" % (args.games * args.rounds, total_plies, total_failures))
+    sys.exit(1 if total_failures else 0)
@@ -1,21 +1,53 @@
 #!/usr/bin/python3.6
 
-import Checkers
-import Players
+import argparse
+import itertools
 
-mcp_iterations = 100
-minimax_depth = 4
-wins = [0, 0]
-iterations = 50
-for i in range(iterations):
-    game = Checkers.Game()
-    #visualizer = Checkers.TerminalGameVisualizer(game)
-    player_one = Players.MinimaxPlayer(minimax_depth)
-    player_two = Players.MonteCarloPlayer(mcp_iterations)
-    runner = Checkers.GameRunner(game, player_one, player_two)
-    result = runner.run()
-    if result is not None:
-        wins[result] += 1
-    print(i, result)
-draws = iterations - wins[0] - wins[1]
-print("1: %d, 2: %d, D: %d" % (wins[0], wins[1], draws))
+import Instrumentation
+import Tournament
+
+parser = argparse.ArgumentParser(description="Play a tournament between player types.")
+parser.add_argument('players', nargs='*', default=['minimax', 'monte_carlo'],
+                    help="player types from single_game.get_player; every pairing is played")
+parser.add_argument('--games', type=int, default=50, help="games per pairing")
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--workers', type=int, default=None)
+parser.add_argument('--engine', choices=sorted(Tournament.ENGINES), default='bitboard')
+parser.add_argument('--move-cache', type=int, default=None, metavar='SIZE',
+                    help="cache legal moves of up to SIZE positions, shared by all games of a worker process")
+parser.add_argument('--book', default=None, help="opening book file built by build_book.py")
+parser.add_argument('--tablebase', default=None, metavar='DIRECTORY',
+                    help="kings-only endgame tables built by build_tablebase.py")
+parser.add_argument('--stored-tree', default=None, metavar='PATH',
+                    help="seed Monte Carlo trees from a file built by build_search_store.py")
+parser.add_argument('--stored-table', default=None, metavar='PATH',
+                    help="back minimax transposition tables with a file built by build_search_store.py, "
+                         "used by players with the evaluation it was built with")
+parser.add_argument('--record', default=None, metavar='PATH', help="append every position played to PATH")
+parser.add_argument('--compress', action='store_true', help="zlib-compress recorded positions")
+parser.add_argument('--value-model', default=None, metavar='PATH',
+                    help="evaluate with a model from train_value_model.py instead of material and rollouts")
+parser.add_argument('--profile', default=None, metavar='PREFIX',
+                    help="write instrumentation to PREFIX.json, .csv and .folded "
+                         "(same as setting %s)" % Instrumentation.ENVIRONMENT)
+parser.add_argument('--no-swap', action='store_true', help="keep the first player as player 1")
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.profile is not None:
+        Instrumentation.enable(args.profile)
+    tournament = Tournament.Tournament(
+        list(itertools.combinations(args.players, 2)), args.games, seed=args.seed,
+        swap_colours=not args.no_swap, engine=args.engine, workers=args.workers,
+        move_cache=args.move_cache, book=args.book, tablebase=args.tablebase,
+        record=args.record, compress_records=args.compress, value_model=args.value_model,
+        stored_tree=args.stored_tree, stored_table=args.stored_table)
+    for result in tournament.run():
+        winner = result['winner']
+        print(result['game'], ' vs '.join(result['players']),
+              'draw' if winner is None else result['players'][winner], "%.2fs" % result['time'])
+    print(tournament.standings.table())
+    if args.move_cache:
+        stats = tournament.move_cache_stats()
+        print("move cache: %d hits, %d misses (%.1f%%), %d evictions" % (
+            stats['hits'], stats['misses'], 100 * stats['hit_rate'], stats['evictions']))
@@ -0,0 +1,30 @@
+#!/usr/bin/python3.6
+
+import argparse
+import asyncio
+
+import GameServer
+import Tournament
+
+parser = argparse.ArgumentParser(description="Host concurrent checkers games over a JSON-lines socket protocol.")
+parser.add_argument('--host', default='127.0.0.1')
+parser.add_argument('--port', type=int, default=8765)
+parser.add_argument('--unix', default=None, help="listen on a unix socket instead of TCP")
+parser.add_argument('--workers', type=int, default=None, help="processes for minimax and monte carlo moves")
+parser.add_argument('--engine', choices=sorted(Tournament.ENGINES), default='bitboard')
+parser.add_argument('--move-timeout', type=float, default=60.0, help="seconds a remote player has per move")
+parser.add_argument('--engine-timeout', type=float, default=30.0,
+                    help="seconds before an engine move is replaced by a random one")
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    server = GameServer.GameServer(args.workers, args.engine, args.move_timeout, args.engine_timeout)
+    loop = asyncio.get_event_loop()
+    task = loop.create_task(server.serve(args.host, args.port, args.unix))
+    try:
+        loop.run_until_complete(task)
+    except KeyboardInterrupt:
+        task.cancel()
+        loop.run_until_complete(asyncio.wait([task]))
+    finally:
+        loop.close()
@@ -4,22 +4,24 @@ import Checkers
 import Players
 import sys
 
+PLAYER_TYPES = {
+    'random': Players.RandomPlayer,
+    'manual': Players.ManualPlayer,
+    'monte_carlo': lambda: Players.MonteCarloPlayer(100),
+    'minimax': lambda: Players.MinimaxPlayer(4),
+    'en_masse': Players.EnMassePlayer,
+    'flanking': Players.FlankingPlayer,
+    'aggressive': Players.AggressivePlayer,
+}
+
 def get_player(player_type):
-    players = {
-        'random': Players.RandomPlayer(),
-        'manual': Players.ManualPlayer(),
-        'monte_carlo': Players.MonteCarloPlayer(100),
-        'minimax': Players.MinimaxPlayer(4),
-        'en_masse': Players.EnMassePlayer(),
-        'flanking': Players.FlankingPlayer(),
-        'aggressive': Players.AggressivePlayer(),
-    }
-    return players[player_type]
+    return PLAYER_TYPES[player_type]()
 
-player_one = get_player(sys.argv[1])
-player_two = get_player(sys.argv[2])
+if __name__ == '__main__':
+    player_one = get_player(sys.argv[1])
+    player_two = get_player(sys.argv[2])
 
-game = Checkers.Game()
-visualizer = Checkers.TerminalGameVisualizer(game)
-runner = Checkers.GameRunner(game, player_one, player_two)
-runner.run()
+    game = Checkers.Game()
+    visualizer = Checkers.TerminalGameVisualizer(game)
+    runner = Checkers.GameRunner(game, player_one, player_two)
+    runner.run()
@@ -0,0 +1,46 @@
+#!/usr/bin/python3.6
+
+import argparse
+
+import numpy as np
+
+import GameRecords
+import ValueModel
+
+parser = argparse.ArgumentParser(description="Train a value model on recorded self-play positions.")
+parser.add_argument('records', nargs='+', help="files written by main.py --record")
+parser.add_argument('--output', default='value_model.npz')
+parser.add_argument('--hidden', type=int, default=0, help="hidden units, 0 for a linear model")
+parser.add_argument('--epochs', type=int, default=5)
+parser.add_argument('--batch-size', type=int, default=256)
+parser.add_argument('--learning-rate', type=float, default=0.05)
+parser.add_argument('--l2', type=float, default=1e-5)
+parser.add_argument('--holdout', type=float, default=0.1, help="share of positions kept for validation")
+parser.add_argument('--seed', type=int, default=0)
+
+
+def chunks(paths, holdout, seed, validation):
+    # the same seed picks the same validation positions every epoch
+    rng = np.random.default_rng(seed)
+    for path in paths:
+        for records in GameRecords.read_chunks(path):
+            selected = (rng.random(len(records)) < holdout) == validation
+            records = records[selected]
+            if len(records):
+                yield ValueModel.record_features(records), ValueModel.record_targets(records)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    model = ValueModel.ValueModel(args.hidden, args.seed)
+    rng = np.random.default_rng(args.seed)
+    for epoch in range(args.epochs):
+        loss = model.train(chunks(args.records, args.holdout, args.seed, False),
+                           args.batch_size, args.learning_rate, args.l2, rng=rng)
+        total, count = 0.0, 0
+        for x, y in chunks(args.records, args.holdout, args.seed, True):
+            total += model.loss(x, y) * len(x)
+            count += len(x)
+        print("epoch %d: training loss %.4f, validation loss %.4f" % (
+            epoch + 1, loss, total / count if count else float('nan')))
+    model.save(args.output)